@@ -1,5 +1,6 @@
 #include "WiFi.h"
 #include "esp_camera.h"
+#include "esp_rom_crc.h"
 
 //
 // --- PIN DEFINITIONS (for AI-THINKER board) ---
@@ -34,6 +35,31 @@ const int WIFI_CHANNEL_WIDTH = 40;  // 40MHz channel width
 const int WIFI_MAX_TX_POWER = 84;  // Max power (20dBm)
 
 WiFiClient client;
+String device_id;  // Sent in the HELLO line, derived from the MAC address
+
+// Push (STREAM) mode state
+bool streaming = false;
+uint32_t stream_interval_ms = 0;
+uint32_t last_stream_frame = 0;
+
+// Frame protocol v2 (see modules/frame_protocol.py): frames are sent as
+// checksummed chunks, and the last frame is held so RESEND can repeat part of it
+int protocol_version = 1;
+uint32_t frame_id = 0;
+uint32_t held_frame_crc = 0;
+camera_fb_t* held_fb = NULL;
+
+struct __attribute__((packed)) ChunkHeader {
+  char magic[4];  // "FRM2"
+  uint32_t frame_id;
+  uint64_t timestamp_us;
+  uint32_t total_size;
+  uint32_t offset;
+  uint32_t length;
+  uint32_t chunk_crc;
+  uint32_t frame_crc;
+  uint32_t header_crc;  // CRC32 of all fields above
+};
 
 // Helper function to get current timestamp as a string
 String getTimestamp() {
@@ -112,9 +138,165 @@ void setup() {
   Serial.printf("%s ESP32 IP Address: ", getTimestamp().c_str());
   Serial.println(WiFi.localIP());
 
+  device_id = "esp32-" + WiFi.macAddress();
+  device_id.replace(":", "");
+
   setupCamera();
 }
 
+uint32_t crc32(const uint8_t* data, size_t len) {
+  return esp_rom_crc32_le(0, data, len);
+}
+
+// Writes the whole buffer, giving up after 20s without progress
+bool writeAll(const uint8_t* buf, size_t len) {
+  uint32_t start_time = millis();
+  while (len > 0 && client.connected()) {
+    size_t sent = client.write(buf, len);
+    if (sent == 0) {
+      if (millis() - start_time > 20000) {
+        Serial.printf("%s Send timeout\n", getTimestamp().c_str());
+        return false;
+      }
+      delay(1);
+      continue;
+    }
+    buf += sent;
+    len -= sent;
+    start_time = millis();
+  }
+  return len == 0;
+}
+
+void sendChunkHeader(uint32_t id, uint64_t timestamp_us, uint32_t total_size,
+                     uint32_t offset, const uint8_t* chunk, uint32_t length) {
+  ChunkHeader header;
+  memcpy(header.magic, "FRM2", 4);
+  header.frame_id = id;
+  header.timestamp_us = timestamp_us;
+  header.total_size = total_size;
+  header.offset = offset;
+  header.length = length;
+  header.chunk_crc = crc32(chunk, length);
+  header.frame_crc = held_frame_crc;
+  header.header_crc = crc32((const uint8_t*)&header, sizeof(header) - 4);
+  writeAll((const uint8_t*)&header, sizeof(header));
+}
+
+// Sends the held frame as v2 chunks, starting at offset
+void sendChunks(uint32_t offset) {
+  const size_t CHUNK_SIZE = 16 * 1024;
+  uint64_t timestamp_us = (uint64_t)held_fb->timestamp.tv_sec * 1000000ULL + held_fb->timestamp.tv_usec;
+
+  while (offset < held_fb->len && client.connected()) {
+    uint32_t length = min((size_t)(held_fb->len - offset), CHUNK_SIZE);
+    sendChunkHeader(frame_id, timestamp_us, held_fb->len, offset, held_fb->buf + offset, length);
+    if (!writeAll(held_fb->buf + offset, length)) {
+      return;
+    }
+    offset += length;
+    yield();
+  }
+}
+
+void releaseHeldFrame() {
+  if (held_fb) {
+    esp_camera_fb_return(held_fb);
+    held_fb = NULL;
+  }
+}
+
+// Captures one frame and sends it as checksummed v2 chunks
+void sendFrameV2() {
+  releaseHeldFrame();
+  held_fb = esp_camera_fb_get();
+  if (!held_fb) {
+    Serial.printf("%s Camera capture failed\n", getTimestamp().c_str());
+    return;
+  }
+
+  frame_id++;
+  held_frame_crc = crc32(held_fb->buf, held_fb->len);
+  Serial.printf("%s Sending frame %u (v2), size: %zu bytes\n", getTimestamp().c_str(), frame_id, held_fb->len);
+  sendChunks(0);
+}
+
+// Captures one frame and sends it as "SIZE <n>\n" followed by the JPEG bytes
+void sendFrame() {
+  if (protocol_version == 2) {
+    sendFrameV2();
+    return;
+  }
+
+  camera_fb_t* fb = esp_camera_fb_get();
+  if (!fb) {
+    Serial.printf("%s Camera capture failed\n", getTimestamp().c_str());
+    client.println("ERR Capture Failed");
+    return;
+  }
+
+  // 1. Send the size header, followed by a newline
+  client.printf("SIZE %zu\n", fb->len);
+  Serial.printf("%s Sending frame, size: %zu bytes\n", getTimestamp().c_str(), fb->len);
+  
+  // 2. Send the raw image data in larger chunks
+  const size_t CHUNK_SIZE = 16 * 1024;  // 16KB chunks
+  size_t to_send = fb->len;
+  const uint8_t* buf_ptr = fb->buf;
+  size_t total_sent = 0;
+  uint32_t start_time = millis();
+  uint32_t last_print = start_time;
+  
+  while (to_send > 0 && client.connected()) {
+    size_t chunk = min(to_send, CHUNK_SIZE);
+    size_t sent = client.write(buf_ptr, chunk);
+    
+    if (sent == 0) {
+      if (millis() - start_time > 20000) {  // 20s timeout
+        Serial.printf("%s Send timeout\n", getTimestamp().c_str());
+        break;
+      }
+      delay(1);
+      continue;
+    }
+    
+    total_sent += sent;
+    buf_ptr += sent;
+    to_send -= sent;
+    
+    // Print progress every 500ms
+    uint32_t now = millis();
+    if (now - last_print >= 500) {
+      float progress = (total_sent * 100.0f) / fb->len;
+      float elapsed = (now - start_time) / 1000.0f;
+      float rate = (total_sent * 8.0f) / (now - start_time);  // kbps
+      
+      Serial.printf("%s Progress: %.1f%% (%.1f kbps)\n", 
+                   getTimestamp().c_str(), progress, rate);
+      last_print = now;
+    }
+    
+    // Small yield to prevent WDT
+    if (total_sent % (CHUNK_SIZE * 4) == 0) {
+      yield();
+    }
+  }
+  
+  uint32_t duration = millis() - start_time;
+  float rate_kbps = (total_sent * 8.0f) / (duration > 0 ? duration : 1);
+  
+  if (to_send == 0) {
+    Serial.printf("%s Frame sent successfully in %.2fs (%.2f kbps)\n", 
+                 getTimestamp().c_str(), duration/1000.0f, rate_kbps);
+  } else {
+    Serial.printf("%s Sent %zu/%zu bytes in %.2fs (%.2f kbps)\n", 
+                 getTimestamp().c_str(), total_sent, fb->len, 
+                 duration/1000.0f, rate_kbps);
+  }
+
+  esp_camera_fb_return(fb);
+}
+
 void loop() {
   // If not connected, try to connect to the server
   if (!client.connected()) {
@@ -126,84 +308,61 @@ void loop() {
       return;
     }
     Serial.printf("\n%s Connected to server!\n", getTimestamp().c_str());
+
+    streaming = false;
+    protocol_version = 1;
+    releaseHeldFrame();
+
+    // Identify ourselves so the server can track several cameras, and offer
+    // frame protocol v2
+    client.printf("HELLO %s PROTO=1,2\n", device_id.c_str());
   }
 
-  // Check if the server has sent a command
+  // Check if the server has sent a command. Commands may be pipelined;
+  // each one is answered in order.
   if (client.available()) {
     String cmd = client.readStringUntil('\n');
     cmd.trim();
     Serial.printf("%s Received command: '%s'\n", getTimestamp().c_str(), cmd.c_str());
-    camera_fb_t* fb = esp_camera_fb_get();
 
     if (cmd == "GET_FRAME") {
-      if (!fb) {
-        Serial.printf("%s Camera capture failed\n", getTimestamp().c_str());
-        client.println("ERR Capture Failed");
-        return;
-      }
-      
-      // 1. Send the size header, followed by a newline
-      client.printf("SIZE %zu\n", fb->len);
-      Serial.printf("%s Sending frame, size: %zu bytes\n", getTimestamp().c_str(), fb->len);
-      
-      // 2. Send the raw image data in larger chunks
-      const size_t CHUNK_SIZE = 16 * 1024;  // 16KB chunks
-      size_t to_send = fb->len;
-      const uint8_t* buf_ptr = fb->buf;
-      size_t total_sent = 0;
-      uint32_t start_time = millis();
-      uint32_t last_print = start_time;
-      
-      while (to_send > 0 && client.connected()) {
-        size_t chunk = min(to_send, CHUNK_SIZE);
-        size_t sent = client.write(buf_ptr, chunk);
-        
-        if (sent == 0) {
-          if (millis() - start_time > 20000) {  // 20s timeout
-            Serial.printf("%s Send timeout\n", getTimestamp().c_str());
-            break;
-          }
-          delay(1);
-          continue;
-        }
-        
-        total_sent += sent;
-        buf_ptr += sent;
-        to_send -= sent;
-        
-        // Print progress every 500ms
-        uint32_t now = millis();
-        if (now - last_print >= 500) {
-          float progress = (total_sent * 100.0f) / fb->len;
-          float elapsed = (now - start_time) / 1000.0f;
-          float rate = (total_sent * 8.0f) / (now - start_time);  // kbps
-          
-          Serial.printf("%s Progress: %.1f%% (%.1f kbps)\n", 
-                       getTimestamp().c_str(), progress, rate);
-          last_print = now;
-        }
-        
-        // Small yield to prevent WDT
-        if (total_sent % (CHUNK_SIZE * 4) == 0) {
-          yield();
-        }
-      }
-      
-      uint32_t duration = millis() - start_time;
-      float rate_kbps = (total_sent * 8.0f) / (duration > 0 ? duration : 1);
-      
-      if (to_send == 0) {
-        Serial.printf("%s Frame sent successfully in %.2fs (%.2f kbps)\n", 
-                     getTimestamp().c_str(), duration/1000.0f, rate_kbps);
+      sendFrame();
+    } else if (cmd.startsWith("STREAM")) {
+      // Push mode: keep sending frames until STOP
+      stream_interval_ms = cmd.substring(6).toInt();
+      streaming = true;
+    } else if (cmd == "STOP") {
+      streaming = false;
+      if (protocol_version == 2) {
+        // An empty chunk marks the end of the stream in v2
+        sendChunkHeader(0, 0, 0, 0, NULL, 0);
       } else {
-        Serial.printf("%s Sent %zu/%zu bytes in %.2fs (%.2f kbps)\n", 
-                     getTimestamp().c_str(), total_sent, fb->len, 
-                     duration/1000.0f, rate_kbps);
+        client.print("STOPPED\n");
+      }
+    } else if (cmd == "PROTO 2") {
+      protocol_version = 2;
+      client.print("PROTO 2\n");
+    } else if (cmd.startsWith("RESEND")) {
+      // RESEND <frame_id> <offset>
+      int first_space = cmd.indexOf(' ');
+      int second_space = cmd.indexOf(' ', first_space + 1);
+      uint32_t id = cmd.substring(first_space + 1, second_space).toInt();
+      uint32_t offset = cmd.substring(second_space + 1).toInt();
+      if (held_fb && id == frame_id) {
+        Serial.printf("%s Resending frame %u from %u\n", getTimestamp().c_str(), id, offset);
+        sendChunks(offset);
       }
     }
+    return;
+  }
 
-    esp_camera_fb_return(fb);
+  if (streaming) {
+    if (millis() - last_stream_frame >= stream_interval_ms) {
+      last_stream_frame = millis();
+      sendFrame();
+    }
+    return;
   }
-  
+
   delay(10); // Small delay to yield to other tasks
 }
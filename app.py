@@ -51,9 +51,10 @@ def main():
     else:
         speak("Photo analysis failed")
 
-    time = datetime.now().isoformat()
-    location = Location.get_location()
-    DYNAMO_DB.add_entry(time, location, description)
+    if description:
+        time = datetime.now().isoformat()
+        location = Location.get_location()
+        DYNAMO_DB.add_entry(time, location, description)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,23 @@
 from modules.cohere_analyzer import CohereImageAnalyzer
+from modules.description_cache import DescriptionCache
 from modules.server import ESP32Server
 
 
 def cohereFlow():
     esp32_server = ESP32Server()
     esp32_server.start()
-    esp32_server.request_frame()
+    # Frame stays in memory; the disk copy is written in the background
+    frame = esp32_server.request_frame_buffer(save_path="received_frame.jpg")
     # MANUAL result, _ = camera_manager.take_snapshot()
+    if frame is None:
+        print("No frame received from the ESP32")
+        esp32_server.close()
+        return
     print("Describing image...")
-    cohere_analyzer = CohereImageAnalyzer()
-    print(
-        cohere_analyzer.describe_image_for_blind_person("received_frame.jpg")
-    )  # debug workflow
+    # Replaying the flow on the same frame doesn't call the model again
+    cohere_analyzer = CohereImageAnalyzer(cache=DescriptionCache())
+    with frame:
+        print(
+            cohere_analyzer.describe_image_for_blind_person(frame.view)
+        )  # debug workflow
     esp32_server.close()
@@ -4,6 +4,8 @@ import speech_recognition as sr
 
 from db.opensearch import OpenSearchClient
 from modules.cohere_answer import CohereAnswer
+from modules.keyword_spotter import KeywordSpotter
+from modules.noise_calibration import NoiseCalibration
 from modules.speak import speak
 
 
@@ -11,10 +13,9 @@ def start_listening():
 
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
-
-    with mic as source:
-        print("Adjusting for ambient noise... Please wait.")
-        recognizer.adjust_for_ambient_noise(source)
+    keyword_spotter = KeywordSpotter(("snapshot", "recall"))
+    calibration = NoiseCalibration()
+    calibration.prepare(recognizer, mic)
 
     print("Listening for keywords 'snapshot' or 'recall'...")
     speak("Ready. Say 'snapshot' to take a photo or 'recall' to ask a question.")
@@ -25,19 +26,21 @@ def start_listening():
                 audio = recognizer.listen(source, timeout=5)
             except sr.WaitTimeoutError:
                 continue
+        calibration.remember(mic, recognizer.energy_threshold)
 
         try:
-            command = recognizer.recognize_google(audio).lower()
-            print(f"Heard: {command}")
+            command = keyword_spotter.command(audio, recognizer)
+            if command:
+                print(f"Heard: {command}")
 
-            if "snapshot" in command:
+            if command == "snapshot":
                 print("Taking snapshot")
                 print("Snapshot command detected")
                 speak("Taking snapshot")
                 # snapshot_result = self.snapshot()
                 # self.remember(snapshot_result)
 
-            elif "recall" in command:
+            elif command == "recall":
                 print("Recall command detected")
                 speak("What would you like to recall?")
                 time.sleep(2)
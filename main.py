@@ -9,11 +9,19 @@ import dotenv
 
 from db.dynamo import DynamoDBInterface
 from db.opensearch import OpenSearchClient
-from modules.cohere_analyzer import CohereImageAnalyzer
+from modules.cohere_analyzer import HAZARD_PROMPTS, CohereImageAnalyzer, CohereVisionProvider
 from modules.cohere_answer import CohereAnswer
+from modules.gemini_vision import GeminiVisionProvider
+from modules.keyword_spotter import KeywordSpotter
 from modules.location import Location
-from modules.pi_camera import PiCameraManager
-from modules.speak import speak
+from modules.noise_calibration import NoiseCalibration
+from modules.pi_camera import PiCameraService
+from modules.scene_gate import SceneChangeGate
+from modules.singleflight import CoalescingAnalyzer
+from modules.audio_capture import AudioCapture
+from modules.audio_output import LOW, URGENT
+from modules.speak import speak, warm_up
+from modules.vision import TIMEOUT, UNAVAILABLE, VisionError
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +30,21 @@ class PhotoError(Exception):
     pass
 
 
+# Fixed prompts, synthesized ahead of time so they play instantly and offline
+SPOKEN_PHRASES = (
+    "Ready. Say 'snapshot' to take a photo or 'recall' to ask a question.",
+    "Taking snapshot",
+    "What would you like to recall?",
+    "Sorry, I didn't understand your question. Please try again.",
+    "Let me take a closer look.",
+    "Take a snapshot first.",
+    "Failed to take photo",
+    "Photo analysis failed",
+    "Sorry, the description service is not responding right now.",
+    "Sorry, I couldn't describe that photo.",
+)
+
+
 class Main:
     def __init__(self, prompt_index=3):
         dotenv.load_dotenv()
@@ -30,64 +53,92 @@ class Main:
             print("COHERE_API_KEY environment variable not set. Exiting.")
             exit(1)
 
-        self.cohere_analyzer = CohereImageAnalyzer(self.cohere_api_key, prompt_index)
+        vision_providers = [CohereVisionProvider(self.cohere_api_key)]
+        if os.getenv("GEMINI_API_KEY"):
+            # A second vendor to race for hazard prompts and fail over to
+            vision_providers.append(GeminiVisionProvider())
+        self.cohere_analyzer = CohereImageAnalyzer(
+            prompt_index=prompt_index,
+            scene_gate=SceneChangeGate(),
+            providers=vision_providers,
+        )
+        # Snapshot commands arriving while one is being analyzed share its answer
+        self.vision = CoalescingAnalyzer(self.cohere_analyzer)
         self.cohere_answer = CohereAnswer()
-        self.camera_manager = PiCameraManager()
+        # Kept running for the whole session so snapshots don't pay startup cost
+        self.camera_manager = PiCameraService()
         self.dynamo_db = DynamoDBInterface()
         self.opensearch_client = OpenSearchClient()
+        # Commands are recognized on the device; only recall queries go to the cloud
+        self.keyword_spotter = KeywordSpotter(("snapshot", "recall", "more"))
 
     def start(self):
+        warm_up(SPOKEN_PHRASES)
+        if not self.camera_manager.start_camera():
+            raise RuntimeError("Failed to start camera. Exiting.")
+
         recognizer = sr.Recognizer()
         mic = sr.Microphone()
 
-        with mic as source:
-            print("Adjusting for ambient noise... Please wait.")
-            recognizer.adjust_for_ambient_noise(source)
+        # Saved from the last session; only measured on a microphone's first use
+        calibration = NoiseCalibration()
+        calibration.prepare(recognizer, mic)
 
-        print("Listening for keywords 'snapshot' or 'recall'...")
+        # The microphone stays open from here on, so nothing said between
+        # phrases or during a prompt is lost
+        capture = AudioCapture(mic, recognizer.energy_threshold, calibration=calibration).start()
+
+        print("Listening for keywords 'snapshot', 'more' or 'recall'...")
         speak("Ready. Say 'snapshot' to take a photo or 'recall' to ask a question.")
 
         while True:
-            with mic as source:
-                try:
-                    audio = recognizer.listen(source, timeout=5)
-                except sr.WaitTimeoutError:
-                    continue
+            audio = capture.next_phrase(timeout=5)
+            if audio is None:
+                continue
+            # The capture thread keeps the threshold in step with the noise floor
+            recognizer.energy_threshold = capture.energy_threshold
 
             try:
-                command = recognizer.recognize_google(audio).lower()
-                print(f"Heard: {command}")
+                command = self.keyword_spotter.command(audio, recognizer)
+                if command:
+                    print(f"Heard: {command}")
 
-                if "snapshot" in command:
-                    if not self.camera_manager.start_camera():
-                        raise RuntimeError("Failed to start camera. Exiting.")
+                if command == "snapshot":
                     print("Taking snapshot")
                     print("Snapshot command detected")
-                    speak("Taking snapshot")
+                    speak("Taking snapshot", LOW, max_age=2)
                     snapshot_result = self.snapshot()
                     self.remember(snapshot_result)
 
-                elif "recall" in command:
+                elif command == "more":
+                    print("More command detected")
+                    self.remember(self.describe_in_detail())
+
+                elif command == "recall":
                     print("Recall command detected")
-                    speak("What would you like to recall?")
-                    time.sleep(2)
-
-                    # Listen for the follow-up query
-                    with mic as source:
-                        try:
-                            query_audio = recognizer.listen(source, timeout=20)
-                            query = recognizer.recognize_google(query_audio).lower()
-                            print(f"Query: {query}")
-                            speak(f"Processing your query: {query}")
-                            self.ask(query)
-                        except (
-                                sr.UnknownValueError,
-                                sr.WaitTimeoutError,
-                                sr.RequestError,
-                        ):
-                            speak(
-                                "Sorry, I didn't understand your question. Please try again."
-                            )
+                    prompt = speak("What would you like to recall?")
+                    prompt.wait(timeout=5)
+                    # Still playing after the wait: skip at least what it said so far
+                    prompt_ended = prompt.finished_at or time.monotonic()
+
+                    # The query may have started during the prompt; phrases
+                    # that ended before it finished are the prompt's own echo
+                    try:
+                        query_audio = capture.next_phrase(timeout=20, ends_after=prompt_ended)
+                        if query_audio is None:
+                            raise sr.WaitTimeoutError("No query heard")
+                        query = recognizer.recognize_google(query_audio).lower()
+                        print(f"Query: {query}")
+                        speak(f"Processing your query: {query}")
+                        self.ask(query)
+                    except (
+                            sr.UnknownValueError,
+                            sr.WaitTimeoutError,
+                            sr.RequestError,
+                    ):
+                        speak(
+                            "Sorry, I didn't understand your question. Please try again."
+                        )
 
             except sr.UnknownValueError:
                 pass
@@ -112,32 +163,79 @@ class Main:
 
     # Remember the description from a snapshot
     def remember(self, desc):
+        if not desc:
+            # Failed snapshots have nothing worth storing
+            return
         try:
             self.add_to_db(desc)
         except PhotoError as e:
             print(f"Error taking photo: {str(e)}")
             speak(str(e))
 
-    # Take a snapshot and describe it
+    # Take a snapshot and describe it, speaking each sentence as it arrives.
+    # Hazard prompts speak a quick hazard summary first and only look closer
+    # when the model is unsure
     def snapshot(self):
         try:
-            snapshotResult = self.take_photo()
-            speak(snapshotResult)
-            return snapshotResult
+            print("Taking photo")
+            if not self.camera_manager.take_photo():
+                raise PhotoError("Failed to take photo")
+            photo = self.camera_manager.saved_photo
+
+            if self.cohere_analyzer.prompt_index not in HAZARD_PROMPTS:
+                return self.speak_description(photo)
+
+            fast = self.vision.analyze_hazards_fast(photo)
+            print(f"Fast hazard pass ({fast.latency_ms:.0f} ms): {fast}")
+            if fast.ok:
+                # Hazards cut off anything still being said
+                speak(fast.description, URGENT)
+                if not fast.low_confidence:
+                    return fast.description
+                speak("Let me take a closer look.")
+            return self.speak_description(photo, detail=True)
         except PhotoError as e:
             print(f"Error taking photo: {str(e)}")
             speak(str(e))
+        except VisionError as e:
+            self.speak_vision_error(e)
+
+    # Describe the last photo again on the full-resolution image
+    def describe_in_detail(self):
+        photo = self.camera_manager.saved_photo
+        if photo is None:
+            speak("Take a snapshot first.")
+            return None
+        try:
+            return self.speak_description(photo, detail=True)
+        except PhotoError as e:
+            speak(str(e))
+        except VisionError as e:
+            self.speak_vision_error(e)
+
+    def speak_description(self, photo, detail=False) -> str:
+        sentences = []
+        for sentence in self.vision.describe_image_stream(photo, detail=detail):
+            print(f"Image description: {sentence}")
+            speak(sentence)
+            sentences.append(sentence)
+        if not sentences:
+            raise PhotoError("Photo analysis failed")
+        return " ".join(sentences)
+
+    def speak_vision_error(self, e: VisionError):
+        print(f"Error analyzing photo ({e.kind}): {e}")
+        if e.kind in (TIMEOUT, UNAVAILABLE):
+            speak("Sorry, the description service is not responding right now.")
+        else:
+            speak("Sorry, I couldn't describe that photo.")
 
     # Take snapshot and return its description
     def take_photo(self) -> str:
         print("Taking photo")
-        if self.camera_manager.take_photo():
-            pass
-        else:
-            self.camera_manager.stop_camera()
+        if not self.camera_manager.take_photo():
             raise PhotoError("Failed to take photo")
 
-        self.camera_manager.stop_camera()
         result = self.camera_manager.analyze_photo(self.cohere_analyzer)
         if result:
             return result
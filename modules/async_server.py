@@ -0,0 +1,367 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from modules.frame_protocol import (
+    CHUNK_HEADER,
+    GET_FRAME,
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    V2_MAGIC,
+    ChunkAssembler,
+    ChunkHeader,
+    FrameProtocolError,
+    choose_version,
+    parse_hello_versions,
+    proto_command,
+    unpack_chunk_header,
+)
+from modules.server import parse_hello, parse_size_header
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Frame:
+    device_id: str
+    seq: int
+    data: bytes
+    received_at: float
+    frame_id: Optional[int] = None
+    captured_at_us: Optional[int] = None
+    # Resolves to a PreprocessedFrame when the server has a preprocessor
+    preprocessed: Optional[asyncio.Future] = None
+
+
+class CameraDevice:
+    """State kept for one camera across reconnects."""
+
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.peer = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task: Optional[asyncio.Task] = None
+        self.latest: Optional[Frame] = None
+        self.seq = 0
+        self.connected = False
+        self.reconnects = 0
+        self.protocol = PROTOCOL_V1
+        self.last_frame_id: Optional[int] = None
+        self.resends = 0
+        self.new_frame = asyncio.Condition()
+
+
+class AsyncESP32Server:
+    """
+    Asyncio frame server that accepts many ESP32 cameras at once.
+
+    Each camera gets its own polling task which keeps requesting frames over
+    the GET_FRAME/SIZE protocol, so a slow camera only delays itself. With
+    pipeline_depth > 1 several requests are kept in flight per camera. Cameras
+    that advertise frame protocol v2 are switched to it, and a corrupt or
+    stalled frame is resent from its last good offset. Cameras
+    are tracked by the id they send in their HELLO line (or their IP address
+    for older firmware). When a camera drops and connects again under the same
+    id, polling resumes on the new connection and its last frame is kept.
+
+    With a FramePreprocessor every received frame is also handed to its
+    worker processes. Polling waits while all preprocessing slots are busy, so
+    cameras are throttled to what the workers can keep up with instead of
+    frames piling up in memory.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 9000,
+        frame_interval: float = 0.0,
+        hello_timeout: float = 2.0,
+        frame_timeout: float = 20.0,
+        pipeline_depth: int = 1,
+        max_retries: int = 3,
+        preprocessor=None,
+    ):
+        self.host = host
+        self.port = port
+        self.frame_interval = frame_interval
+        self.hello_timeout = hello_timeout
+        self.frame_timeout = frame_timeout
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.max_retries = max_retries
+        self.preprocessor = preprocessor
+        self.devices: Dict[str, CameraDevice] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self._handle_client, self.host, self.port
+        )
+        sockname = self.server.sockets[0].getsockname()
+        self.port = sockname[1]
+        logger.info(f"✅ [LISTENING] Server is listening on {sockname[0]}:{self.port}")
+
+    async def serve_forever(self):
+        if not self.server:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for device in self.devices.values():
+            if device.task:
+                device.task.cancel()
+            if device.writer:
+                device.writer.close()
+
+    def device_ids(self) -> List[str]:
+        return list(self.devices)
+
+    def connected_device_ids(self) -> List[str]:
+        return [d.device_id for d in self.devices.values() if d.connected]
+
+    async def wait_for_device(self, device_id: str, timeout: Optional[float] = None):
+        await asyncio.wait_for(self._wait_connected(device_id), timeout)
+
+    async def _wait_connected(self, device_id: str):
+        while device_id not in self.devices or not self.devices[device_id].connected:
+            await asyncio.sleep(0.05)
+
+    async def get_latest_frame(
+        self, device_id: str, newer_than: int = 0, timeout: Optional[float] = None
+    ) -> Frame:
+        """
+        Returns the newest frame received from a camera.
+
+        Args:
+            device_id: Id the camera announced, or its IP address.
+            newer_than: Only return a frame whose seq is greater than this,
+                        waiting for the camera if needed.
+            timeout: Seconds to wait before raising asyncio.TimeoutError.
+        """
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = CameraDevice(device_id)
+
+        async def wait():
+            async with device.new_frame:
+                await device.new_frame.wait_for(
+                    lambda: device.latest is not None and device.latest.seq > newer_than
+                )
+                return device.latest
+
+        return await asyncio.wait_for(wait(), timeout)
+
+    async def _handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        device_id = peer[0] if peer else "unknown"
+        first_line = b""
+
+        try:
+            first_line = await asyncio.wait_for(reader.readline(), self.hello_timeout)
+        except asyncio.TimeoutError:
+            # Older firmware stays silent until it is asked for a frame
+            pass
+
+        hello_id = parse_hello(first_line.strip().decode("utf-8", "replace"))
+        if hello_id:
+            device_id = hello_id
+        elif first_line:
+            logger.warning(f"Unexpected first line from {peer}: {first_line!r}")
+
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = CameraDevice(device_id)
+        elif device.connected:
+            # The camera reconnected before we noticed the old socket died
+            logger.info(f"[RECONNECT] {device_id} replaced its previous connection")
+            device.writer.close()
+        if device.peer is not None:
+            device.reconnects += 1
+
+        device.peer = peer
+        device.writer = writer
+        device.connected = True
+        device.task = asyncio.current_task()
+        logger.info(f"[NEW CLIENT] {device_id} connected from {peer}")
+
+        try:
+            device.protocol = PROTOCOL_V1
+            if hello_id:
+                versions = parse_hello_versions(first_line.decode("utf-8", "replace"))
+                if choose_version(versions) == PROTOCOL_V2:
+                    device.protocol = await self._negotiate_v2(reader, writer)
+            logger.info(f"{device_id} uses frame protocol v{device.protocol}")
+
+            await self._poll_frames(device, reader, writer)
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.TimeoutError,
+            ConnectionError,
+            FrameProtocolError,
+        ) as e:
+            logger.warning(f"[DISCONNECTED] {device_id}: {e!r}")
+        finally:
+            if device.writer is writer:
+                device.connected = False
+                device.writer = None
+            writer.close()
+
+    async def _poll_frames(self, device: CameraDevice, reader, writer):
+        # Keep pipeline_depth requests outstanding so the camera is never idle
+        # while we are handling the previous frame
+        writer.write(GET_FRAME * (self.pipeline_depth - 1))
+        while True:
+            writer.write(GET_FRAME)
+            await writer.drain()
+
+            if device.protocol == PROTOCOL_V2:
+                frame = await self._read_frame_v2(device, reader, writer)
+            else:
+                header = await asyncio.wait_for(reader.readline(), self.frame_timeout)
+                if not header:
+                    raise ConnectionError("Client disconnected.")
+                size = parse_size_header(header.strip().decode("utf-8", "replace"))
+                data = await asyncio.wait_for(reader.readexactly(size), self.frame_timeout)
+                frame = Frame(device.device_id, 0, data, time.time())
+
+            if self.preprocessor:
+                # Waits for a free slot, so no more frames are requested
+                # while the workers are behind
+                frame.preprocessed = await self.preprocessor.submit_async(frame.data)
+
+            async with device.new_frame:
+                device.seq += 1
+                frame.seq = device.seq
+                device.latest = frame
+                device.new_frame.notify_all()
+
+            if self.frame_interval:
+                await asyncio.sleep(self.frame_interval)
+
+    async def _negotiate_v2(self, reader, writer) -> int:
+        writer.write(proto_command(PROTOCOL_V2))
+        await writer.drain()
+        try:
+            ack = await asyncio.wait_for(reader.readline(), self.hello_timeout)
+        except asyncio.TimeoutError:
+            return PROTOCOL_V1
+        if ack.strip() == proto_command(PROTOCOL_V2).strip():
+            return PROTOCOL_V2
+        return PROTOCOL_V1
+
+    async def _read_frame_v2(self, device: CameraDevice, reader, writer) -> Frame:
+        # With several requests queued a resend would interleave with the next
+        # frame, so only a single outstanding request gets retried
+        resend = self.pipeline_depth == 1
+        assembler = ChunkAssembler(self.max_retries, device.last_frame_id)
+        data = None
+
+        while not assembler.complete:
+            try:
+                header = await asyncio.wait_for(
+                    _read_chunk_header(reader), self.frame_timeout
+                )
+                if not assembler.accepts(header):
+                    await asyncio.wait_for(
+                        reader.readexactly(header.length), self.frame_timeout
+                    )
+                    if not assembler.is_gap(header):
+                        continue
+                    command = assembler.retry()
+                    if resend:
+                        device.resends += 1
+                        writer.write(command)
+                        await writer.drain()
+                        continue
+                    raise FrameProtocolError(f"Missing chunk from {device.device_id}")
+                if data is None:
+                    data = bytearray(header.total_size)
+
+                payload = await asyncio.wait_for(
+                    reader.readexactly(header.length), self.frame_timeout
+                )
+                if not assembler.verify(header, payload):
+                    command = assembler.retry()
+                else:
+                    data[header.offset:header.offset + header.length] = payload
+                    if not assembler.complete or assembler.verify_frame(data):
+                        continue
+                    command = assembler.retry(0)
+            except asyncio.TimeoutError:
+                if not resend:
+                    raise
+                command = assembler.retry()
+
+            if not resend:
+                raise FrameProtocolError(f"Corrupt frame from {device.device_id}")
+            device.resends += 1
+            logger.warning(f"{device.device_id}: resending from offset {assembler.next_offset}")
+            writer.write(command)
+            await writer.drain()
+
+        device.last_frame_id = assembler.header.frame_id
+        return Frame(
+            device.device_id,
+            0,
+            data,
+            time.time(),
+            assembler.header.frame_id,
+            assembler.header.timestamp_us,
+        )
+
+
+async def _read_chunk_header(reader: asyncio.StreamReader) -> ChunkHeader:
+    """Reads the next valid v2 chunk header, skipping any garbage before it."""
+    data = b""
+    while True:
+        start = data.find(V2_MAGIC)
+        if start < 0:
+            partial = _partial_magic(data)
+            if partial:
+                # The magic may continue in the bytes still to come
+                data = data[-partial:] + await reader.readexactly(1)
+                continue
+            try:
+                await reader.readuntil(V2_MAGIC)
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+                data = b""
+                continue
+            data, start = V2_MAGIC, 0
+        data = data[start:]
+        if len(data) < CHUNK_HEADER.size:
+            data += await reader.readexactly(CHUNK_HEADER.size - len(data))
+        try:
+            return unpack_chunk_header(data)
+        except FrameProtocolError:
+            # Magic bytes inside payload data; the real header may start in
+            # the bytes just read, so keep scanning after them
+            data = data[1:]
+
+
+def _partial_magic(data: bytes) -> int:
+    """Length of the longest start of V2_MAGIC that data ends with."""
+    for length in range(min(len(data), len(V2_MAGIC) - 1), 0, -1):
+        if data.endswith(V2_MAGIC[:length]):
+            return length
+    return 0
+
+
+async def _main():
+    logging.basicConfig(level=logging.INFO)
+    server = AsyncESP32Server()
+    await server.start()
+    while True:
+        await asyncio.sleep(5)
+        for device_id in server.connected_device_ids():
+            frame = await server.get_latest_frame(device_id)
+            logger.info(f"{device_id}: frame #{frame.seq}, {len(frame.data)} bytes")
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,248 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import speech_recognition as sr
+
+from modules.noise_calibration import NoiseCalibration
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Segment:
+    """One phrase found by the capture thread, as ring buffer sample positions."""
+
+    start: int
+    end: int
+    started_at: float
+    ended_at: float
+
+
+class PcmRingBuffer:
+    """
+    Fixed-size buffer of the most recent int16 samples.
+
+    Positions are absolute sample counts since capture started, so a reader
+    can tell whether what it wants has been overwritten yet.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.written = 0
+        self._samples = np.zeros(capacity, dtype=np.int16)
+        self._lock = threading.Lock()
+
+    def write(self, samples: np.ndarray):
+        with self._lock:
+            self.written += len(samples)
+            samples = samples[-self.capacity:]
+            offset = (self.written - len(samples)) % self.capacity
+            first = min(len(samples), self.capacity - offset)
+            self._samples[offset:offset + first] = samples[:first]
+            self._samples[:len(samples) - first] = samples[first:]
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Samples [start, end), minus any that were already overwritten."""
+        with self._lock:
+            start = max(start, self.written - self.capacity)
+            end = min(end, self.written)
+            if end <= start:
+                return np.zeros(0, dtype=np.int16)
+            first, last = start % self.capacity, end % self.capacity
+            if first < last:
+                return self._samples[first:last].copy()
+            return np.concatenate((self._samples[first:], self._samples[:last]))
+
+
+class AudioCapture:
+    """
+    Records the microphone continuously in a background thread.
+
+    The microphone is opened once and every chunk goes into a ring buffer,
+    so nothing is lost between phrases or while a prompt is being spoken.
+    The same thread splits the audio into phrases with an energy-based
+    voice activity detector (as Recognizer.listen() does) and queues them;
+    next_phrase() returns the next one as sr.AudioData, including phrases
+    that began before it was called.
+
+    Args:
+        microphone: The sr.Microphone to record from.
+        energy_threshold: Chunk RMS that counts as speech.
+        buffer_seconds: Audio kept in the ring buffer.
+        pause_threshold: Seconds of quiet that end a phrase.
+        pre_roll: Seconds kept before the first loud chunk, for soft onsets.
+        min_phrase: Shortest voiced stretch (seconds) that counts as a phrase.
+        max_phrase: Phrases are cut off at this length (seconds).
+        dynamic_energy_threshold: Follow the noise floor between phrases,
+                                  the way Recognizer.listen() does.
+        calibration: Where the adapted threshold is saved for next time.
+    """
+
+    def __init__(
+        self,
+        microphone: sr.Microphone,
+        energy_threshold: float = 300.0,
+        buffer_seconds: float = 30.0,
+        pause_threshold: float = 0.8,
+        pre_roll: float = 0.3,
+        min_phrase: float = 0.15,
+        max_phrase: float = 15.0,
+        dynamic_energy_threshold: bool = True,
+        calibration: Optional[NoiseCalibration] = None,
+    ):
+        self.microphone = microphone
+        self.energy_threshold = energy_threshold
+        self.buffer_seconds = buffer_seconds
+        self.pause_threshold = pause_threshold
+        self.pre_roll = pre_roll
+        self.min_phrase = min_phrase
+        self.max_phrase = max_phrase
+        self.dynamic_energy_threshold = dynamic_energy_threshold
+        # Same defaults as sr.Recognizer
+        self.dynamic_energy_adjustment_damping = 0.15
+        self.dynamic_energy_ratio = 1.5
+        self.calibration = calibration
+        self.phrases = 0
+        self.dropped = 0
+        self.buffer: Optional[PcmRingBuffer] = None
+        self.sample_rate = 0
+        self.sample_width = 2
+        self._segments: "queue.Queue[Segment]" = queue.Queue(maxsize=32)
+        self._running = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "AudioCapture":
+        if self._thread is not None:
+            return self
+        source = self.microphone.__enter__()
+        self.sample_rate = source.SAMPLE_RATE
+        self.sample_width = source.SAMPLE_WIDTH
+        if self.sample_width != 2:
+            self.microphone.__exit__(None, None, None)
+            raise ValueError("Only 16-bit microphones are supported")
+        self.buffer = PcmRingBuffer(int(self.buffer_seconds * self.sample_rate))
+        self._running.set()
+        self._thread = threading.Thread(
+            target=self._run, args=(source,), name="audio-capture", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def next_phrase(
+        self, timeout: Optional[float] = None, ends_after: Optional[float] = None
+    ) -> Optional[sr.AudioData]:
+        """
+        Returns the next phrase, or None if there is none within timeout.
+
+        Phrases that ended before the time.monotonic() value ends_after are
+        skipped, e.g. the device's own prompt picked up by the microphone.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                segment = self._segments.get(timeout=remaining)
+            except queue.Empty:
+                return None
+            if ends_after is not None and segment.ended_at < ends_after:
+                continue
+            samples = self.buffer.read(segment.start, segment.end)
+            if len(samples) < segment.end - segment.start:
+                logger.warning("Phrase was partly overwritten before it was read")
+            return sr.AudioData(samples.tobytes(), self.sample_rate, self.sample_width)
+
+    def clear(self):
+        """Discards phrases that haven't been read yet."""
+        while True:
+            try:
+                self._segments.get_nowait()
+            except queue.Empty:
+                return
+
+    def stats(self) -> dict:
+        return {"phrases": self.phrases, "dropped": self.dropped, "pending": self._segments.qsize()}
+
+    def _run(self, source):
+        rate = self.sample_rate
+        pause = int(self.pause_threshold * rate)
+        pre_roll = int(self.pre_roll * rate)
+        min_voiced = int(self.min_phrase * rate)
+        max_length = int(self.max_phrase * rate)
+        start: Optional[int] = None
+        voiced = 0
+        quiet = 0
+        try:
+            while self._running.is_set():
+                try:
+                    chunk = np.frombuffer(
+                        source.stream.read(source.CHUNK), dtype=np.int16
+                    )
+                except OSError as e:
+                    # Input overflow and the like; the buffer just skips ahead
+                    logger.warning(f"Audio capture read failed: {e}")
+                    continue
+                self.buffer.write(chunk)
+                end = self.buffer.written
+                energy = _rms(chunk)
+                loud = energy > self.energy_threshold
+
+                if start is None:
+                    if loud:
+                        start = max(0, end - len(chunk) - pre_roll)
+                        voiced, quiet = len(chunk), 0
+                    elif self.dynamic_energy_threshold:
+                        self._adapt(energy, len(chunk) / rate)
+                    continue
+
+                if loud:
+                    voiced += len(chunk)
+                    quiet = 0
+                else:
+                    quiet += len(chunk)
+                if quiet >= pause or end - start >= max_length:
+                    if voiced >= min_voiced:
+                        self._emit(start, end)
+                    start = None
+        finally:
+            self.microphone.__exit__(None, None, None)
+            if self.calibration is not None:
+                self.calibration.remember(self.microphone, self.energy_threshold, force=True)
+
+    def _adapt(self, energy: float, seconds: float):
+        """Moves the threshold towards a multiple of the current background energy."""
+        damping = self.dynamic_energy_adjustment_damping ** seconds
+        target = energy * self.dynamic_energy_ratio
+        self.energy_threshold = self.energy_threshold * damping + target * (1 - damping)
+        if self.calibration is not None:
+            self.calibration.remember(self.microphone, self.energy_threshold)
+
+    def _emit(self, start: int, end: int):
+        ended_at = time.monotonic()
+        segment = Segment(start, end, ended_at - (end - start) / self.sample_rate, ended_at)
+        try:
+            self._segments.put_nowait(segment)
+            self.phrases += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+def _rms(chunk: np.ndarray) -> float:
+    samples = chunk.astype(np.float32)
+    return float(np.sqrt((samples * samples).mean())) if len(samples) else 0.0
@@ -0,0 +1,248 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import playsound
+
+try:
+    import gi
+
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+
+    Gst.init(None)
+except (ImportError, ValueError):
+    # Without GStreamer, playback falls back to playsound and can't be cut short
+    Gst = None
+
+logger = logging.getLogger(__name__)
+
+# Utterance priorities, most urgent first
+URGENT = 0
+NORMAL = 1
+LOW = 2
+
+# Utterance.status values
+QUEUED = "queued"
+PLAYING = "playing"
+DONE = "done"
+INTERRUPTED = "interrupted"
+DROPPED = "dropped"
+CANCELLED = "cancelled"
+FAILED = "failed"
+
+
+class Utterance:
+    """
+    Handle for one queued piece of speech.
+
+    started is set when audio begins playing and finished once the utterance
+    is over for any reason; status says which (done, interrupted, dropped as
+    stale, cancelled or failed).
+    """
+
+    def __init__(self, text: str, priority: int = NORMAL, max_age: Optional[float] = None):
+        self.text = text
+        self.priority = priority
+        self.max_age = max_age
+        self.created_at = time.monotonic()
+        self.status = QUEUED
+        self.error: Optional[BaseException] = None
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        # Set to cut playback short; players check it while playing
+        self.interrupt = threading.Event()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def stale(self) -> bool:
+        return self.max_age is not None and time.monotonic() - self.created_at > self.max_age
+
+    def mark_started(self):
+        """Called by the player when the first audio goes out."""
+        if not self.started.is_set():
+            self.status = PLAYING
+            self.started_at = time.monotonic()
+            self.started.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the utterance is over; False on timeout."""
+        return self.finished.wait(timeout)
+
+    def cancel(self):
+        """Drops the utterance if queued, or stops it if playing."""
+        if not self.finished.is_set():
+            self.interrupt.set()
+            if not self.started.is_set():
+                self._finish(CANCELLED)
+
+    def _finish(self, status: str, error: Optional[BaseException] = None):
+        if self.finished.is_set():
+            return
+        self.status = status
+        self.error = error
+        self.finished_at = time.monotonic()
+        self.finished.set()
+
+    def __repr__(self):
+        return f"Utterance({self.text!r}, priority={self.priority}, status={self.status})"
+
+
+class AudioWorker:
+    """
+    The one thread that owns the audio output.
+
+    Utterances are played one at a time, most urgent first and in call order
+    within a priority. An URGENT utterance interrupts a less urgent one that
+    is playing; one that was interrupted before any audio went out is put
+    back in the queue, otherwise it ends as interrupted. Utterances older
+    than their max_age when their turn comes are dropped unplayed.
+
+    Args:
+        play: play(utterance) produces the audio, calling
+              utterance.mark_started() when playback begins, and returns
+              False if it stopped early because utterance.interrupt was set.
+    """
+
+    def __init__(self, play: Callable[[Utterance], bool]):
+        self.play = play
+        self.played = 0
+        self.interrupted = 0
+        self.dropped = 0
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._current: Optional[Utterance] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def say(self, text: str, priority: int = NORMAL, max_age: Optional[float] = None) -> Utterance:
+        utterance = Utterance(text, priority, max_age)
+        self._start()
+        with self._lock:
+            self._queue.put((priority, next(self._order), utterance))
+            current = self._current
+            if priority == URGENT and current is not None and current.priority > priority:
+                current.interrupt.set()
+        return utterance
+
+    def stop(self, priority: int = LOW):
+        """Interrupts the current utterance and cancels queued ones of at least this priority."""
+        with self._lock:
+            pending = []
+            while True:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for item in pending:
+                if item[2].priority >= priority:
+                    item[2].cancel()
+                else:
+                    self._queue.put(item)
+            if self._current is not None and self._current.priority >= priority:
+                self._current.interrupt.set()
+
+    @property
+    def current(self) -> Optional[Utterance]:
+        return self._current
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "played": self.played,
+            "interrupted": self.interrupted,
+            "dropped": self.dropped,
+            "pending": self.pending(),
+        }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            priority, order, utterance = self._queue.get()
+            if utterance.finished.is_set():
+                continue
+            if utterance.stale:
+                self.dropped += 1
+                logger.info(f"Dropped stale {utterance}")
+                utterance._finish(DROPPED)
+                continue
+
+            with self._lock:
+                self._current = utterance
+                # An urgent one queued while this was being taken off the queue
+                with self._queue.mutex:
+                    head = self._queue.queue[0][0] if self._queue.queue else None
+                if head == URGENT and priority > URGENT:
+                    utterance.interrupt.set()
+            try:
+                completed = self.play(utterance)
+            except Exception as e:
+                logger.error(f"Error speaking {utterance.text!r}: {e}")
+                utterance._finish(FAILED, e)
+                continue
+            finally:
+                with self._lock:
+                    self._current = None
+
+            if completed:
+                self.played += 1
+                utterance._finish(DONE)
+            elif utterance.finished.is_set():
+                # Cancelled by the caller
+                continue
+            elif not utterance.started.is_set():
+                # Preempted before any of it was heard: play it after the interruption
+                utterance.interrupt.clear()
+                self._queue.put((priority, order, utterance))
+            else:
+                self.interrupted += 1
+                utterance._finish(INTERRUPTED)
+
+
+def play_file(path: str, utterance: Optional[Utterance] = None) -> bool:
+    """
+    Plays an audio file, returning False if utterance.interrupt stopped it.
+
+    Uses a GStreamer playbin when available so playback can be stopped
+    midway; otherwise plays it through playsound to the end.
+    """
+    if utterance is not None and utterance.interrupt.is_set():
+        return False
+    if Gst is None:
+        if utterance is not None:
+            utterance.mark_started()
+        playsound.playsound(path)
+        return True
+
+    playbin = Gst.ElementFactory.make("playbin", None)
+    playbin.props.uri = Gst.filename_to_uri(os.path.abspath(path))
+    bus = playbin.get_bus()
+    try:
+        playbin.set_state(Gst.State.PLAYING)
+        if utterance is not None:
+            utterance.mark_started()
+        while utterance is None or not utterance.interrupt.is_set():
+            message = bus.timed_pop_filtered(
+                50 * Gst.MSECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR
+            )
+            if message is None:
+                continue
+            if message.type == Gst.MessageType.ERROR:
+                error, _ = message.parse_error()
+                raise RuntimeError(f"Playback of {path} failed: {error.message}")
+            return True
+        return False
+    finally:
+        playbin.set_state(Gst.State.NULL)
@@ -5,6 +5,7 @@ import cv2
 from cv2_enumerate_cameras import enumerate_cameras
 
 from modules.cohere_analyzer import CohereImageAnalyzer
+from modules.image_utils import pick_sharpest
 
 
 class CameraManager:
@@ -55,13 +56,16 @@ class CameraManager:
             return True
         return False
 
-    def take_snapshot(self):
+    def take_snapshot(self, burst_size=1):
         if not self.running or not self.cap:
             return None
 
-        ret, frame = self.cap.read()
+        if burst_size > 1:
+            frame = self._capture_sharpest(burst_size)
+            ret = frame is not None
+        else:
+            ret, frame = self.cap.read()
         if not ret:
-            print(e.message)
             print("Error: Could not capture frame from camera")
             return None
 
@@ -92,6 +96,22 @@ class CameraManager:
             print("Error: Failed to save image")
             return None
 
+    def _capture_sharpest(self, burst_size):
+        frames = []
+        for _ in range(burst_size):
+            ret, frame = self.cap.read()
+            if ret:
+                frames.append(frame)
+        if not frames:
+            return None
+
+        best, scores, ms_per_frame = pick_sharpest(frames)
+        print(
+            f"Picked frame {best + 1}/{len(frames)} (sharpness {scores[best]:.0f}, "
+            f"scoring {ms_per_frame:.2f} ms/frame)"
+        )
+        return frames[best]
+
     def show_captured_photo(self, filepath):
         img = cv2.imread(filepath)
         if img is not None:
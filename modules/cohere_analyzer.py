@@ -1,9 +1,30 @@
+import asyncio
 import base64
+import math
 import os
-from typing import Optional
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import cohere
 
+from modules.frame_preprocessor import PreprocessedFrame
+from modules.image_utils import AnyImage, content_digest, prepare_jpeg
+from modules.rate_limiter import AsyncRateLimiter
+from modules.resilience import CircuitOpenError, DeadlineExceeded, hedged_call, hedged_call_async
+from modules.sentences import iter_sentences, split_sentences
+from modules.vision import (
+    API_ERROR,
+    BAD_IMAGE,
+    LOW_CONFIDENCE,
+    TIMEOUT,
+    UNAVAILABLE,
+    VisionError,
+    VisionProvider,
+    VisionResult,
+)
+
 
 def cohere_prompt(index: int) -> str:
     prompts_list = [
@@ -73,49 +94,520 @@ def cohere_prompt(index: int) -> str:
 
 AYA_VISION_MODEL = "c4ai-aya-vision-32b"
 
+# Prompts where a fast answer matters most; these race two providers
+HAZARD_PROMPTS = (2, 3)
 
-class CohereImageAnalyzer:
-    def __init__(self, api_key: Optional[str] = None, prompt_index: int = 0):
+# First tier of the hazard mode: a small frame and a short answer, followed
+# by a confidence line that decides whether the detailed pass is needed
+FAST_HAZARD_PROMPT = """
+Help a visually impaired person walk safely. In at most 20 words, name the
+most important hazard or obstacle and where it is (e.g. "Step down 2 feet
+ahead."). If the way looks clear, say so.
+Then, on a new line, write "Confidence: high" or "Confidence: low". Use low
+if the image is blurry, dark, or you are unsure.
+"""
+# Cache key for FAST_HAZARD_PROMPT; cohere_prompt() indices are >= 0
+FAST_HAZARD_PROMPT_INDEX = -1
+
+_CONFIDENCE_LINE = re.compile(r"\s*\**confidence\**\s*:\s*\**\s*(high|medium|low)\b\W*\s*$", re.I)
+
+
+def parse_confidence(text: str) -> Tuple[str, Optional[str]]:
+    """Splits a trailing "Confidence: high|medium|low" line off an answer."""
+    match = _CONFIDENCE_LINE.search(text)
+    if not match:
+        return text.strip(), None
+    return text[: match.start()].strip(), match.group(1).lower()
+
+
+def _prompt_text(prompt_index: int) -> str:
+    if prompt_index == FAST_HAZARD_PROMPT_INDEX:
+        return FAST_HAZARD_PROMPT
+    return cohere_prompt(prompt_index)
+
+
+class _Tier(NamedTuple):
+    prompt_index: int
+    long_edge: Optional[int]
+    max_tokens: Optional[int]
+    deadline: Optional[float]
+    use_scene_gate: bool
+    race: bool
+
+# A path to a JPEG on disk, the JPEG bytes themselves (e.g. a frame buffer
+# view), a decoded NumPy frame such as Picamera2's capture_array(), or the
+# output of a FramePreprocessor
+ImageInput = Union[AnyImage, PreprocessedFrame]
+
+
+class CohereVisionProvider(VisionProvider):
+    name = "cohere"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = AYA_VISION_MODEL):
         self.api_key = api_key or os.getenv("COHERE_API_KEY")
         if not self.api_key:
             raise ValueError(
                 "Cohere API key is required. Set COHERE_API_KEY environment variable or pass it directly."
             )
-
+        self.model = model
+        super().__init__()
         self.client = cohere.ClientV2(self.api_key)
-        self.model = AYA_VISION_MODEL
+        # Used by describe_async(); created on first use
+        self._async_client = None
+
+    def describe(self, jpeg, prompt, max_tokens=None, timeout=None) -> str:
+        response = self.client.chat(**self._chat_args(jpeg, prompt, max_tokens, timeout))
+        return response.message.content[0].text
+
+    async def describe_async(self, jpeg, prompt, max_tokens=None, timeout=None) -> str:
+        if self._async_client is None:
+            self._async_client = cohere.AsyncClientV2(self.api_key)
+        response = await self._async_client.chat(
+            **self._chat_args(jpeg, prompt, max_tokens, timeout)
+        )
+        return response.message.content[0].text
+
+    def stream(self, jpeg, prompt, max_tokens=None, timeout=None) -> Iterator[str]:
+        stream = self.client.chat_stream(**self._chat_args(jpeg, prompt, max_tokens, timeout))
+        for event in stream:
+            if event.type == "content-delta":
+                yield event.delta.message.content.text
+
+    def _chat_args(self, jpeg, prompt, max_tokens, timeout) -> dict:
+        image_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+        args = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": image_url}},
+                    ],
+                }
+            ],
+        }
+        if max_tokens is not None:
+            args["max_tokens"] = max_tokens
+        if timeout is not None:
+            # Lets abandoned attempts end on their own after the deadline
+            args["request_options"] = {"timeout_in_seconds": math.ceil(timeout)}
+        return args
+
+
+class CohereImageAnalyzer:
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        prompt_index: int = 0,
+        scene_gate=None,
+        max_long_edge: Optional[int] = 1024,
+        jpeg_quality: int = 75,
+        requests_per_minute: Optional[float] = None,
+        cache=None,
+        deadline: Optional[float] = 15.0,
+        hedge_after: Optional[float] = 5.0,
+        providers: Optional[Sequence[VisionProvider]] = None,
+        race_hazards: bool = True,
+        fast_long_edge: int = 384,
+        fast_max_tokens: int = 60,
+        fast_deadline: Optional[float] = 4.0,
+        detail_long_edge: Optional[int] = None,
+    ):
+        # Vision models to use, Cohere's Aya Vision unless others are given.
+        # Each call goes to the provider with the best recent latency
+        self.providers: List[VisionProvider] = list(providers or [CohereVisionProvider(api_key)])
+        cohere_provider = next(
+            (p for p in self.providers if isinstance(p, CohereVisionProvider)), None
+        )
+        self.api_key = cohere_provider.api_key if cohere_provider else api_key
+        self.client = cohere_provider.client if cohere_provider else None
         self.prompt_index = prompt_index
+        # Optional SceneChangeGate that reuses the last description for
+        # near-duplicate frames instead of calling the model again
+        self.scene_gate = scene_gate
+        # Optional DescriptionCache; an image whose bytes were described
+        # before with the same model and prompt isn't sent again
+        self.cache = cache
+        # Images are downscaled to this long edge and re-encoded before upload;
+        # the model doesn't need full sensor resolution to describe a scene
+        self.max_long_edge = max_long_edge
+        self.jpeg_quality = jpeg_quality
+        self.last_upload_bytes = 0
+        # Caps the request rate of the async methods, shared across batches
+        self.requests_per_minute = requests_per_minute
+        self._rate_limiter = None
+        # Each call gives up after `deadline` seconds. A call still running
+        # after hedge_after seconds gets a second, racing request (to the
+        # next best provider if there is one). Hazard prompts race the two
+        # best providers from the start when race_hazards is set
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.race_hazards = race_hazards
+        # Hazard mode tiers: the fast pass sends a small frame with a token
+        # cap and a tight deadline; the detailed pass sends the full frame
+        # (detail_long_edge=None) when asked for more or on low confidence
+        self.fast_long_edge = fast_long_edge
+        self.fast_max_tokens = fast_max_tokens
+        self.fast_deadline = fast_deadline
+        self.detail_long_edge = detail_long_edge
+        self._executor = ThreadPoolExecutor(4, thread_name_prefix="vision")
 
-    def encode_image_to_base64(self, image_path: str) -> str:
-        with open(image_path, "rb") as img_file:
-            base64_image_url = f"data:image/jpeg;base64,{base64.b64encode(img_file.read()).decode('utf-8')}"
-            return base64_image_url
+    @property
+    def model(self) -> str:
+        """Model of the provider that would be tried first."""
+        return self.ranked_providers()[0].model
 
-    def describe_image_for_blind_person(self, image_path: str) -> str:
+    def ranked_providers(self) -> List[VisionProvider]:
+        """Providers by recent latency, those with an open circuit last."""
+        return sorted(
+            self.providers,
+            key=lambda p: (p.breaker.state == p.breaker.OPEN, p.score()),
+        )
+
+    def provider_stats(self) -> dict:
+        return {
+            p.name: {**p.stats.summary(), "circuit": p.breaker.state}
+            for p in self.providers
+        }
+
+    def prepare_image(self, image: ImageInput):
+        """Returns the JPEG bytes that would be uploaded for an image."""
+        return self._prepare(image, self.max_long_edge)
+
+    def _prepare(self, image: ImageInput, max_long_edge: Optional[int]):
+        if isinstance(image, PreprocessedFrame):
+            # Already downscaled, so this is normally a pass-through
+            image = image.jpeg
+        jpeg = prepare_jpeg(image, max_long_edge, self.jpeg_quality)
+        self.last_upload_bytes = len(jpeg)
+        return jpeg
+
+    def encode_image_to_base64(self, image: ImageInput) -> str:
+        jpeg = self.prepare_image(image)
+        base64_image_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+        return base64_image_url
+
+    def analyze(self, image_path: ImageInput) -> VisionResult:
+        """Describes an image for a blind person; never raises."""
+        return self._analyze(image_path, self._tier())
+
+    def analyze_hazards_fast(self, image_path: ImageInput) -> VisionResult:
+        """
+        First tier of hazard mode: names the main hazard from a small frame
+        within fast_deadline. result.confidence is "low" when the model was
+        unsure, which is the cue to follow up with analyze_detailed().
+        """
+        return self._analyze(image_path, self._tier(fast=True))
+
+    def analyze_detailed(self, image_path: ImageInput) -> VisionResult:
+        """Second tier: the configured prompt on the full-resolution frame."""
+        return self._analyze(image_path, self._tier(detail=True))
+
+    def _analyze(self, image_path: ImageInput, tier: _Tier) -> VisionResult:
+        start = time.perf_counter()
+        result = self._lookup(image_path, tier)
+        if isinstance(result, VisionResult):
+            return result
+        thumbnail, digest, jpeg = result
+
+        prompt = _prompt_text(tier.prompt_index)
+        first, second, hedge_after = self._plan(tier)
         try:
-            image_base64 = self.encode_image_to_base64(image_path)
+            (provider, description), hedged = hedged_call(
+                self._executor,
+                lambda: self._attempt(first, jpeg, prompt, tier),
+                tier.deadline,
+                hedge_after,
+                lambda: self._attempt(second, jpeg, prompt, tier),
+            )
+        except Exception as e:
+            return _failure(e, start)
 
-            prompt = cohere_prompt(self.prompt_index)
+        confidence = None
+        if tier.prompt_index == FAST_HAZARD_PROMPT_INDEX:
+            description, confidence = parse_confidence(description)
+        if confidence != LOW_CONFIDENCE:
+            # A guess the model itself doubted isn't worth serving again
+            self._remember(thumbnail, digest, description, provider.model, tier)
+        return VisionResult(
+            description,
+            latency_ms=_elapsed_ms(start),
+            hedged=hedged,
+            provider=provider.name,
+            confidence=confidence,
+        )
 
-            response = self.client.chat(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": image_base64}},
-                        ],
-                    }
-                ],
+    def describe_image_for_blind_person(self, image_path: ImageInput) -> str:
+        """Returns the description, raising VisionError if there is none."""
+        result = self.analyze(image_path)
+        if not result.ok:
+            raise VisionError(result)
+        return result.description
+
+    def describe_image_stream(self, image_path: ImageInput, detail: bool = False) -> Iterator[str]:
+        """
+        Streaming version of describe_image_for_blind_person().
+
+        Yields the description a sentence at a time as the model generates
+        it, so speech can start before the whole response has arrived.
+        Raises VisionError on failure, possibly after some sentences. Streams
+        go to the best provider only; the deadline still applies. With
+        detail=True this is the streaming form of analyze_detailed().
+        """
+        start = time.perf_counter()
+        tier = self._tier(detail=detail)
+        result = self._lookup(image_path, tier)
+        if isinstance(result, VisionResult):
+            if not result.ok:
+                raise VisionError(result)
+            yield from split_sentences(result.description)
+            return
+        thumbnail, digest, jpeg = result
+
+        provider = self.ranked_providers()[0]
+        sentences = []
+        try:
+            provider.breaker.check()
+            stream = provider.stream(
+                jpeg, _prompt_text(tier.prompt_index), tier.max_tokens, tier.deadline
             )
+            for sentence in iter_sentences(stream):
+                if self.deadline is not None and time.perf_counter() - start > self.deadline:
+                    raise DeadlineExceeded(f"No full response within {self.deadline:.1f}s")
+                sentences.append(sentence)
+                yield sentence
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                provider.stats.record(_elapsed_ms(start), False)
+                provider.breaker.record_failure()
+            raise VisionError(_failure(e, start)) from e
 
-            return response.message.content[0].text
+        provider.stats.record(_elapsed_ms(start), True)
+        provider.breaker.record_success()
+        self._remember(thumbnail, digest, " ".join(sentences), provider.model, tier)
 
+    async def analyze_async(self, image_path: ImageInput) -> VisionResult:
+        """Async version of analyze()."""
+        start = time.perf_counter()
+        # Hashing and re-encoding are CPU work; keep them off the event loop
+        tier = self._tier()
+        result = await asyncio.to_thread(self._lookup, image_path, tier)
+        if isinstance(result, VisionResult):
+            return result
+        thumbnail, digest, jpeg = result
+
+        prompt = _prompt_text(tier.prompt_index)
+        # Waiting for the rate limit doesn't count towards the deadline or
+        # the hedge delay; a hedge request waits for its own turn
+        await self._throttle()
+        first, second, hedge_after = self._plan(tier)
+        try:
+            (provider, description), hedged = await hedged_call_async(
+                lambda: self._attempt_async(first, jpeg, prompt, tier),
+                tier.deadline,
+                hedge_after,
+                lambda: self._attempt_async(second, jpeg, prompt, tier, throttle=True),
+            )
         except Exception as e:
-            return f"Error analyzing image: {str(e)}"
+            return _failure(e, start)
+
+        self._remember(thumbnail, digest, description, provider.model, tier)
+        return VisionResult(
+            description, latency_ms=_elapsed_ms(start), hedged=hedged, provider=provider.name
+        )
+
+    async def describe_image_async(self, image_path: ImageInput) -> str:
+        """Async version of describe_image_for_blind_person()."""
+        result = await self.analyze_async(image_path)
+        if not result.ok:
+            raise VisionError(result)
+        return result.description
+
+    async def describe_many(
+        self,
+        images: Iterable[ImageInput],
+        max_concurrency: int = 4,
+    ) -> AsyncIterator[Tuple[int, VisionResult]]:
+        """
+        Describes many images with up to max_concurrency requests in flight.
+
+        Yields (index, VisionResult) pairs as each request completes, so the
+        order follows completion rather than the input. Images are read from
+        the iterable lazily. Requests also respect requests_per_minute.
 
-    def get_simple_description(self, image_path: str) -> str:
+        Example:
+            async for i, result in analyzer.describe_many(paths, 8):
+                print(paths[i], result.description or result.error)
+        """
+        pending = iter(enumerate(images))
+        results = asyncio.Queue()
+
+        async def worker():
+            for index, image in pending:
+                await results.put((index, await self.analyze_async(image)))
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, max_concurrency))]
+        done = asyncio.gather(*workers)
+        try:
+            while not done.done() or not results.empty():
+                get = asyncio.ensure_future(results.get())
+                await asyncio.wait({get, done}, return_when=asyncio.FIRST_COMPLETED)
+                if get.done():
+                    yield get.result()
+                else:
+                    get.cancel()
+            # Surfaces any exception raised by a worker
+            await done
+        finally:
+            for task in workers:
+                task.cancel()
+
+    def _tier(self, fast: bool = False, detail: bool = False) -> _Tier:
+        if fast:
+            # The gate holds a single description, which is the default
+            # tier's; a hazard summary would be served in its place
+            return _Tier(
+                FAST_HAZARD_PROMPT_INDEX,
+                self.fast_long_edge,
+                self.fast_max_tokens,
+                self.fast_deadline,
+                use_scene_gate=False,
+                race=True,
+            )
+        if detail:
+            # Asked for when a closer look is wanted, so never answered from
+            # the gate (and not remembered there either)
+            return _Tier(
+                self.prompt_index,
+                self.detail_long_edge,
+                None,
+                self.deadline,
+                use_scene_gate=False,
+                race=False,
+            )
+        return _Tier(
+            self.prompt_index,
+            self.max_long_edge,
+            None,
+            self.deadline,
+            use_scene_gate=True,
+            race=self.prompt_index in HAZARD_PROMPTS,
+        )
+
+    def _plan(self, tier: _Tier):
+        """Returns (first provider, hedge provider, seconds before hedging)."""
+        ranked = self.ranked_providers()
+        second = ranked[1] if len(ranked) > 1 else ranked[0]
+        if self.race_hazards and tier.race and len(ranked) > 1:
+            return ranked[0], second, 0.0
+        return ranked[0], second, self.hedge_after
+
+    def _attempt(self, provider: VisionProvider, jpeg, prompt: str, tier: _Tier):
+        provider.breaker.check()
+        start = time.perf_counter()
+        try:
+            description = provider.describe(jpeg, prompt, tier.max_tokens, tier.deadline)
+        except Exception:
+            provider.stats.record(_elapsed_ms(start), False)
+            provider.breaker.record_failure()
+            raise
+        provider.stats.record(_elapsed_ms(start), True)
+        provider.breaker.record_success()
+        return provider, description
+
+    async def _attempt_async(
+        self, provider: VisionProvider, jpeg, prompt: str, tier: _Tier, throttle: bool = False
+    ):
+        provider.breaker.check()
+        if throttle:
+            await self._throttle()
+        start = time.perf_counter()
+        try:
+            description = await provider.describe_async(
+                jpeg, prompt, tier.max_tokens, tier.deadline
+            )
+        except asyncio.CancelledError:
+            # Lost a race; says nothing about the provider
+            raise
+        except Exception:
+            provider.stats.record(_elapsed_ms(start), False)
+            provider.breaker.record_failure()
+            raise
+        provider.stats.record(_elapsed_ms(start), True)
+        provider.breaker.record_success()
+        return provider, description
+
+    def _lookup(self, image: ImageInput, tier: _Tier):
+        """
+        Returns a VisionResult if the image needs no model call (a scene gate
+        or cache hit, or an image that can't be read), otherwise
+        (thumbnail, digest, JPEG bytes) for the request.
+        """
+        start = time.perf_counter()
+        thumbnail, previous = None, None
+        if tier.use_scene_gate:
+            thumbnail, previous = self._check_scene_gate(image)
+        if previous:
+            return VisionResult(previous, source="scene_gate", latency_ms=_elapsed_ms(start))
+        digest, cached = self._check_cache(image, tier)
+        if cached:
+            self._remember(thumbnail, None, cached)
+            return VisionResult(cached, source="cache", latency_ms=_elapsed_ms(start))
+
+        try:
+            return thumbnail, digest, self._prepare(image, tier.long_edge)
+        except (OSError, TypeError, ValueError) as e:
+            return VisionResult.failure(BAD_IMAGE, e, _elapsed_ms(start))
+
+    def _check_scene_gate(self, image: ImageInput):
+        """Returns (thumbnail, previous description) from the scene gate."""
+        if not self.scene_gate:
+            return None, None
+        try:
+            thumbnail = self.scene_gate.thumbnail(image)
+        except ValueError:
+            return None, None
+        return thumbnail, self.scene_gate.lookup(thumbnail)
+
+    def _check_cache(self, image: ImageInput, tier: _Tier):
+        """Returns (content digest, cached description) from the cache."""
+        if self.cache is None:
+            return None, None
+        try:
+            if isinstance(image, PreprocessedFrame):
+                digest = image.digest
+            else:
+                digest = content_digest(image)
+        except (OSError, TypeError, ValueError):
+            return None, None
+        models = [p.model for p in self.ranked_providers()]
+        return digest, self.cache.get_any(digest, models, tier.prompt_index, tier.long_edge)
+
+    def _remember(
+        self,
+        thumbnail,
+        digest: Optional[str],
+        description: str,
+        model: str = "",
+        tier: Optional[_Tier] = None,
+    ):
+        if thumbnail is not None:
+            self.scene_gate.remember(thumbnail, description)
+        if digest is not None:
+            tier = tier or self._tier()
+            self.cache.put(digest, model, tier.prompt_index, description, tier.long_edge)
+
+    async def _throttle(self):
+        if self.requests_per_minute:
+            await self._get_rate_limiter().acquire()
+
+    def _get_rate_limiter(self) -> AsyncRateLimiter:
+        if self._rate_limiter is None:
+            self._rate_limiter = AsyncRateLimiter(self.requests_per_minute, per=60.0)
+        return self._rate_limiter
+
+    def get_simple_description(self, image_path: ImageInput) -> str:
         try:
             image_base64 = self.encode_image_to_base64(image_path)
 
@@ -132,7 +624,21 @@ class CohereImageAnalyzer:
             return response.text
 
         except Exception as e:
-            return f"Error analyzing image: {str(e)}"
+            raise VisionError(VisionResult.failure(API_ERROR, e)) from e
+
+
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
+
+
+def _failure(error: Exception, start: float) -> VisionResult:
+    if isinstance(error, CircuitOpenError):
+        kind = UNAVAILABLE
+    elif isinstance(error, TimeoutError):
+        kind = TIMEOUT
+    else:
+        kind = API_ERROR
+    return VisionResult.failure(kind, error, _elapsed_ms(start))
 
 
 if __name__ == "__main__":
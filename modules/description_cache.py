@@ -0,0 +1,162 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "description_cache.sqlite3"
+
+
+class DescriptionCache:
+    """
+    Persistent cache of image descriptions, keyed by image content.
+
+    Entries are keyed by a hash of the image bytes together with the model
+    name, prompt index and the long edge the image was sent at (0 for full
+    resolution), so the same image described with a different prompt, model
+    or resolution is a separate entry. The cache lives in a SQLite file and
+    keeps at most max_entries rows, evicting the least recently used.
+
+    Args:
+        path: SQLite file, or ":memory:" for a cache that isn't persisted.
+        max_entries: Rows kept before the least recently used are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL without fsync on every commit keeps lookups (which also update
+        # last_used) in the tens of microseconds
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(descriptions)")]
+        if columns and "long_edge" not in columns:
+            # Written before the resolution was part of the key; start over
+            self._db.execute("DROP TABLE descriptions")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS descriptions (
+                digest TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_index INTEGER NOT NULL,
+                long_edge INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (digest, model, prompt_index, long_edge)
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS descriptions_last_used ON descriptions (last_used)"
+        )
+
+    def get(
+        self, digest: str, model: str, prompt_index: int, long_edge: Optional[int] = None
+    ) -> Optional[str]:
+        key = (digest, model, prompt_index, long_edge or 0)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT description FROM descriptions "
+                "WHERE digest = ? AND model = ? AND prompt_index = ? AND long_edge = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE descriptions SET last_used = ? "
+                "WHERE digest = ? AND model = ? AND prompt_index = ? AND long_edge = ?",
+                (time.time(), *key),
+            )
+            self.hits += 1
+            return row[0]
+
+    def get_any(
+        self,
+        digest: str,
+        models: Sequence[str],
+        prompt_index: int,
+        long_edge: Optional[int] = None,
+    ) -> Optional[str]:
+        """Like get(), accepting an entry from any of the given models."""
+        if not models:
+            return None
+        long_edge = long_edge or 0
+        with self._lock:
+            placeholders = ", ".join("?" * len(models))
+            row = self._db.execute(
+                "SELECT description, model FROM descriptions "
+                "WHERE digest = ? AND prompt_index = ? AND long_edge = ? "
+                f"AND model IN ({placeholders}) "
+                "ORDER BY last_used DESC LIMIT 1",
+                (digest, prompt_index, long_edge, *models),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE descriptions SET last_used = ? "
+                "WHERE digest = ? AND model = ? AND prompt_index = ? AND long_edge = ?",
+                (time.time(), digest, row[1], prompt_index, long_edge),
+            )
+            self.hits += 1
+            return row[0]
+
+    def put(
+        self,
+        digest: str,
+        model: str,
+        prompt_index: int,
+        description: str,
+        long_edge: Optional[int] = None,
+    ):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (digest, model, prompt_index, long_edge or 0, description, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM descriptions").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM descriptions WHERE rowid IN "
+                "(SELECT rowid FROM descriptions ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            logger.info(f"Evicted {excess} cached descriptions")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM descriptions")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "entries": len(self),
+        }
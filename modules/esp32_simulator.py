@@ -0,0 +1,302 @@
+import argparse
+import logging
+import os
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+from typing import Optional, Sequence
+
+from modules.frame_protocol import (
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    SUPPORTED_VERSIONS,
+    crc32,
+    hello_line,
+    pack_chunk_header,
+    proto_command,
+)
+
+logger = logging.getLogger(__name__)
+
+# Same chunking as sendFrame() in CameraWebServer.ino
+CHUNK_SIZE = 16 * 1024
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+def fake_jpeg(size: int, capture_time: Optional[float] = None) -> bytes:
+    """
+    Builds `size` bytes that look like a JPEG (SOI ... EOI).
+
+    When capture_time is given it is embedded right after the SOI marker so a
+    benchmark on the same machine can measure how old a frame is on arrival.
+    """
+    size = max(size, 12)
+    stamp = struct.pack("<d", capture_time if capture_time is not None else 0.0)
+    body = os.urandom(size - len(JPEG_SOI) - len(stamp) - len(JPEG_EOI))
+    return JPEG_SOI + stamp + body + JPEG_EOI
+
+
+def frame_capture_time(frame: bytes) -> float:
+    """Reads the timestamp embedded by fake_jpeg()."""
+    return struct.unpack_from("<d", frame, len(JPEG_SOI))[0]
+
+
+class SimulatedESP32:
+    """
+    Pure-Python stand-in for the ESP32 running CameraWebServer.ino.
+
+    It connects to the server, announces itself with HELLO and then speaks the
+    same protocol as the firmware byte for byte: GET_FRAME is answered with
+    "SIZE <n>\\n" and the frame, STREAM <ms> pushes frames until STOP, and STOP
+    is acknowledged with STOPPED. Commands are handled in order, so pipelined
+    requests behave as they do on the device. If the server asks for frame
+    protocol v2, frames are sent as checksummed chunks and RESEND is honoured.
+
+    Args:
+        frame_sizes: Frame sizes in bytes; each frame picks one at random.
+        bandwidth_bps: Link speed in bits per second (None for unlimited).
+        jitter: Maximum extra random delay in seconds added to every frame.
+        capture_time: Seconds spent "capturing" before a frame is sent.
+        send_hello: Set False to behave like firmware without HELLO support.
+        protocol_versions: Versions advertised in HELLO; (1,) for old firmware.
+        corrupt_rate: Chance that a v2 chunk is sent with a flipped byte.
+        drop_rate: Chance that a v2 chunk is silently left out.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 9000,
+        device_id: str = "esp32-sim",
+        frame_sizes: Sequence[int] = (120_000,),
+        bandwidth_bps: Optional[float] = None,
+        jitter: float = 0.0,
+        capture_time: float = 0.0,
+        send_hello: bool = True,
+        seed: Optional[int] = None,
+        protocol_versions: Sequence[int] = SUPPORTED_VERSIONS,
+        corrupt_rate: float = 0.0,
+        drop_rate: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.device_id = device_id
+        self.frame_sizes = list(frame_sizes)
+        self.bandwidth_bps = bandwidth_bps
+        self.jitter = jitter
+        self.capture_time = capture_time
+        self.send_hello = send_hello
+        self.random = random.Random(seed)
+        self.protocol_versions = tuple(protocol_versions)
+        self.corrupt_rate = corrupt_rate
+        self.drop_rate = drop_rate
+        self.protocol = PROTOCOL_V1
+        self.frame_id = 0
+        self.held_frame = None
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.resends = 0
+        self.sock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def connect(self, retry_for: float = 10.0):
+        # Like the firmware, keep retrying until the server is up
+        deadline = time.monotonic() + retry_for
+        while True:
+            try:
+                self.sock = socket.create_connection((self.host, self.port))
+                break
+            except ConnectionRefusedError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.send_hello:
+            if PROTOCOL_V2 in self.protocol_versions:
+                self.sock.sendall(hello_line(self.device_id, self.protocol_versions))
+            else:
+                self.sock.sendall(f"HELLO {self.device_id}\n".encode("utf-8"))
+
+    def run(self):
+        """Serves commands until the server disconnects or stop() is called."""
+        if self.sock is None:
+            self.connect()
+
+        commands = queue.Queue()
+        reader = threading.Thread(
+            target=self._read_commands, args=(commands,), daemon=True
+        )
+        reader.start()
+
+        streaming = False
+        interval = 0.0
+        last_frame = 0.0
+        try:
+            while not self._stop.is_set():
+                try:
+                    if streaming:
+                        wait = last_frame + interval - time.monotonic()
+                        cmd = commands.get(timeout=max(0.0, wait))
+                    else:
+                        cmd = commands.get()
+                except queue.Empty:
+                    last_frame = time.monotonic()
+                    self.send_frame()
+                    continue
+
+                if cmd is None:
+                    break
+                if cmd == "GET_FRAME":
+                    self.send_frame()
+                elif cmd.startswith("STREAM"):
+                    parts = cmd.split()
+                    interval = int(parts[1]) / 1000 if len(parts) > 1 else 0.0
+                    streaming = True
+                elif cmd == "STOP":
+                    streaming = False
+                    if self.protocol == PROTOCOL_V2:
+                        # An empty chunk marks the end of the stream in v2
+                        self.sock.sendall(pack_chunk_header(0, 0, 0, 0, b"", 0))
+                    else:
+                        self.sock.sendall(b"STOPPED\n")
+                elif cmd.startswith("PROTO"):
+                    version = int(cmd.split()[1])
+                    if version in self.protocol_versions:
+                        self.protocol = version
+                        self.sock.sendall(proto_command(version))
+                elif cmd.startswith("RESEND"):
+                    _, frame_id, offset = cmd.split()
+                    self.resend(int(frame_id), int(offset))
+        except (BrokenPipeError, ConnectionError):
+            pass
+        finally:
+            self.close()
+
+    def start(self) -> "SimulatedESP32":
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def send_frame(self):
+        size = self.random.choice(self.frame_sizes)
+        delay = self.capture_time
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        capture_time = time.time()
+        frame = fake_jpeg(size, capture_time)
+        self.frames_sent += 1
+
+        if self.protocol == PROTOCOL_V2:
+            # Like the firmware, hold on to the frame until the next one so
+            # chunks can be resent
+            self.frame_id += 1
+            self.held_frame = (self.frame_id, int(capture_time * 1e6), frame, crc32(frame))
+            self._send_chunks(0)
+            return
+
+        self.sock.sendall(f"SIZE {size}\n".encode("utf-8"))
+
+        view = memoryview(frame)
+        for offset in range(0, size, CHUNK_SIZE):
+            chunk = view[offset:offset + CHUNK_SIZE]
+            self._throttle(len(chunk))
+            self.sock.sendall(chunk)
+        self.bytes_sent += size
+
+    def resend(self, frame_id: int, offset: int):
+        if not self.held_frame or self.held_frame[0] != frame_id:
+            logger.warning(f"Cannot resend frame {frame_id}, it is no longer held")
+            return
+        self.resends += 1
+        self._send_chunks(offset)
+
+    def _send_chunks(self, start: int):
+        frame_id, timestamp_us, frame, frame_crc = self.held_frame
+        view = memoryview(frame)
+        for offset in range(start, len(frame), CHUNK_SIZE):
+            chunk = view[offset:offset + CHUNK_SIZE]
+            header = pack_chunk_header(
+                frame_id, timestamp_us, len(frame), offset, chunk, frame_crc
+            )
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                continue
+            if self.corrupt_rate and self.random.random() < self.corrupt_rate:
+                damaged = bytearray(chunk)
+                damaged[self.random.randrange(len(damaged))] ^= 0xFF
+                chunk = damaged
+            self._throttle(len(header) + len(chunk))
+            self.sock.sendall(header)
+            self.sock.sendall(chunk)
+            self.bytes_sent += len(chunk)
+
+    def _throttle(self, size: int):
+        if self.bandwidth_bps:
+            time.sleep(size * 8 / self.bandwidth_bps)
+
+    def _read_commands(self, commands: queue.Queue):
+        try:
+            with self.sock.makefile("rb") as rfile:
+                for line in rfile:
+                    commands.put(line.strip().decode("utf-8", "replace"))
+        except (OSError, ValueError):
+            pass
+        commands.put(None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated ESP32 camera")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--device-id", default="esp32-sim")
+    parser.add_argument("--frame-size", type=int, nargs="+", default=[120_000])
+    parser.add_argument("--bandwidth-mbps", type=float, default=None)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--capture-ms", type=float, default=0.0)
+    parser.add_argument("--protocol", type=int, nargs="+", default=list(SUPPORTED_VERSIONS))
+    parser.add_argument("--corrupt-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sim = SimulatedESP32(
+        args.host,
+        args.port,
+        args.device_id,
+        args.frame_size,
+        args.bandwidth_mbps * 1e6 if args.bandwidth_mbps else None,
+        args.jitter_ms / 1000,
+        args.capture_ms / 1000,
+        protocol_versions=args.protocol,
+        corrupt_rate=args.corrupt_rate,
+        drop_rate=args.drop_rate,
+    )
+    sim.connect(retry_for=float("inf"))
+    logger.info(f"Connected to {args.host}:{args.port} as {args.device_id}")
+    sim.run()
+    logger.info(f"Sent {sim.frames_sent} frames, {sim.bytes_sent} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# A UXGA JPEG at quality 50 from the ESP32 is usually well under this
+DEFAULT_BUFFER_CAPACITY = 512 * 1024
+
+
+class FrameBufferPool:
+    """
+    A fixed set of preallocated bytearrays that frames are received into.
+
+    Reusing the same buffers avoids allocating a fresh bytes object for every
+    frame. acquire() blocks while every buffer is leased out, which bounds the
+    memory used by frames that are still being analyzed or saved.
+    """
+
+    def __init__(self, count: int = 4, capacity: int = DEFAULT_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(capacity))
+
+    def acquire(self, size: int, timeout: Optional[float] = None) -> "PooledFrame":
+        buf = self._free.get(timeout=timeout)
+        if len(buf) < size:
+            # Oversized frame; replace the buffer rather than failing
+            logger.info(f"Growing frame buffer from {len(buf)} to {size} bytes")
+            buf = bytearray(size)
+        return PooledFrame(self, buf, size)
+
+    def _release(self, buf: bytearray):
+        self._free.put(buf)
+
+    def _discard(self, buf: bytearray):
+        # Something still reads the old buffer, so a fresh one takes its place
+        logger.warning("Frame buffer still in use after release(), not reusing it")
+        self._free.put(bytearray(len(buf)))
+
+    def available(self) -> int:
+        return self._free.qsize()
+
+
+class PooledFrame:
+    """
+    A frame leased from a FrameBufferPool.
+
+    `view` is a memoryview over exactly the frame bytes and can be handed to
+    anything that accepts a bytes-like object. The buffer goes back to the
+    pool once every holder has called release(), so anything that keeps a
+    slice of `view` or an array made from it (np.frombuffer) must copy it or
+    retain() the frame first. A buffer that is still referenced when the
+    last holder releases it is dropped from the pool instead of reused.
+    """
+
+    def __init__(self, pool: FrameBufferPool, buf: bytearray, size: int):
+        self._pool = pool
+        self._buf = buf
+        self._refs = 1
+        self._lock = threading.Lock()
+        self.size = size
+        self.view = memoryview(buf)[:size]
+
+    def retain(self) -> "PooledFrame":
+        with self._lock:
+            if self._refs == 0:
+                raise RuntimeError("Frame buffer was already released")
+            self._refs += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            if self._refs == 0:
+                # Releasing twice would put the buffer in the pool twice
+                raise RuntimeError("Frame buffer was already released")
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        try:
+            self.view.release()
+        except BufferError:
+            # An array made from the view; caught by the check below
+            pass
+        if _exported(self._buf):
+            self._pool._discard(self._buf)
+        else:
+            self._pool._release(self._buf)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def _exported(buf: bytearray) -> bool:
+    """True if a memoryview or array still refers to buf."""
+    try:
+        # A bytearray with live exports can't change size
+        buf.append(0)
+    except BufferError:
+        return True
+    buf.pop()
+    return False
+
+
+class FrameWriter:
+    """
+    Background thread that persists frames to disk.
+
+    Frames are written straight from their pooled buffer, so callers can carry
+    on with the in-memory frame while the (slow, on a Pi SD card) write
+    happens. If the writer falls behind, new frames are dropped rather than
+    stalling the receive path.
+    """
+
+    def __init__(self, max_pending: int = 2):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def save(self, frame: PooledFrame, path: str) -> bool:
+        frame.retain()
+        try:
+            self._queue.put_nowait((frame, path))
+            return True
+        except queue.Full:
+            frame.release()
+            self.dropped += 1
+            logger.warning(f"Frame writer is behind, not saving {path}")
+            return False
+
+    def flush(self):
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            frame, path = self._queue.get()
+            try:
+                with open(path, "wb") as f:
+                    f.write(frame.view)
+                logger.info(f"✅ Frame saved as {path}")
+            except OSError as e:
+                logger.error(f"Error saving frame to {path}: {e}")
+            finally:
+                frame.release()
+                self._queue.task_done()
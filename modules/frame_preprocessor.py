@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from modules.image_utils import (
+    AnyImage,
+    encode_jpeg,
+    gray_thumbnail,
+    jpeg_size,
+    load_image_reduced,
+    resize_long_edge,
+    sharpness,
+)
+
+logger = logging.getLogger(__name__)
+
+# Enough for a 1280x720 BGR frame from Picamera2 or a full UXGA JPEG
+DEFAULT_SLOT_CAPACITY = 1280 * 720 * 3
+
+
+@dataclass
+class PreprocessedFrame:
+    """
+    A frame that is ready to upload.
+
+    jpeg is downscaled to the preprocessor's max_long_edge, digest is a hash
+    of the original input, thumbnail is the raw grayscale thumbnail used by
+    SceneChangeGate and sharpness is the score from image_utils.sharpness().
+    """
+
+    jpeg: bytes
+    width: int
+    height: int
+    digest: str
+    thumbnail: np.ndarray
+    sharpness: float
+    worker_ms: float
+
+
+# Shared memory blocks attached in this worker process, by name
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def _init_worker():
+    # One worker per core already; OpenCV's own threads would just compete
+    cv2.setNumThreads(1)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    shm = _attached.get(name)
+    if shm is None:
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching also registers the block with the
+            # resource tracker, which would unlink it when this worker exits
+            shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        _attached[name] = shm
+    return shm
+
+
+def _preprocess(
+    name: str,
+    size: int,
+    shape: Optional[Tuple[int, ...]],
+    dtype: Optional[str],
+    max_long_edge: Optional[int],
+    quality: int,
+    thumbnail_size: Tuple[int, int],
+):
+    """
+    Runs in a worker process. Reads the input from the shared memory slot and
+    writes the output JPEG back into the same slot, so only the small
+    metadata is pickled.
+    """
+    start = time.perf_counter()
+    buf = _attach(name).buf
+    data = buf[:size]
+
+    if shape is not None:
+        image = np.ndarray(shape, dtype=dtype, buffer=buf)
+        jpeg_dims = None
+    else:
+        jpeg_dims = jpeg_size(data)
+        image = load_image_reduced(data, max_long_edge, jpeg_dims)
+
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    thumbnail = gray_thumbnail(image, thumbnail_size)
+    score = sharpness(image)
+
+    data.release()
+    if jpeg_dims and (max_long_edge is None or max(jpeg_dims) <= max_long_edge):
+        # Small enough already; the input bytes are the output
+        out = size
+        width, height = jpeg_dims
+    else:
+        if max_long_edge is not None:
+            image = resize_long_edge(image, max_long_edge)
+        height, width = image.shape[:2]
+        jpeg = encode_jpeg(image, quality)
+        if jpeg.nbytes <= len(buf):
+            out = jpeg.nbytes
+            buf[:out] = jpeg.data
+        else:
+            # Only possible with tiny slots; fall back to pickling the bytes
+            out = jpeg.tobytes()
+
+    worker_ms = (time.perf_counter() - start) * 1000
+    return out, width, height, digest, thumbnail, score, worker_ms
+
+
+class FramePreprocessor:
+    """
+    Decodes, downscales, hashes and re-encodes frames in a process pool.
+
+    Frames are copied once into one of a fixed number of shared memory slots
+    and the worker reads them from there, so large frames are never pickled.
+    Each in-flight frame holds a slot until its result has been copied out,
+    which bounds both memory and queue length: submit() waits for a free slot
+    (or, with block=False, drops the frame) when the workers fall behind.
+
+    Args:
+        workers: Worker processes (defaults to one per CPU core).
+        slots: Frames that may be queued or in progress at once.
+        slot_capacity: Bytes per slot; larger frames grow their slot.
+        max_long_edge: Long edge the output JPEG is downscaled to.
+        jpeg_quality: Quality used when re-encoding.
+        thumbnail_size: (width, height) of the scene-change thumbnail.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        slots: Optional[int] = None,
+        slot_capacity: int = DEFAULT_SLOT_CAPACITY,
+        max_long_edge: Optional[int] = 1024,
+        jpeg_quality: int = 75,
+        thumbnail_size: Tuple[int, int] = (32, 24),
+    ):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_long_edge = max_long_edge
+        self.jpeg_quality = jpeg_quality
+        self.thumbnail_size = thumbnail_size
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.worker_ms = 0.0
+        self._lock = threading.Lock()
+        self._slots = [
+            shared_memory.SharedMemory(create=True, size=slot_capacity)
+            for _ in range(slots or 2 * self.workers)
+        ]
+        self._free = queue.Queue()
+        for index in range(len(self._slots)):
+            self._free.put(index)
+
+        # Forking a process that already runs audio and camera threads is
+        # unsafe, so workers start from a clean interpreter
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        self._pool = ProcessPoolExecutor(
+            self.workers, mp_context=context, initializer=_init_worker
+        )
+
+    def submit(
+        self, image: AnyImage, block: bool = True, timeout: Optional[float] = None
+    ) -> Optional[Future]:
+        """
+        Queues a frame and returns a Future for its PreprocessedFrame.
+
+        Waits for a free slot when every slot is busy. Returns None if no slot
+        became free (block=False, or the timeout ran out); the frame is then
+        counted as dropped.
+        """
+        future = self._submit(image, block, timeout)
+        if future is None:
+            with self._lock:
+                self.dropped += 1
+        return future
+
+    async def submit_async(
+        self, image: AnyImage, timeout: Optional[float] = None
+    ) -> asyncio.Future:
+        """
+        Like submit(), for asyncio code. Waiting for a free slot doesn't block
+        the event loop, and the returned asyncio future resolves to the
+        PreprocessedFrame.
+        """
+        future = self._submit(image, block=False)
+        if future is None:
+            # Wait for a slot in a thread so the event loop keeps running
+            future = await asyncio.to_thread(self._submit, image, True, timeout)
+            if future is None:
+                raise TimeoutError("No free preprocessing slot")
+        return asyncio.wrap_future(future)
+
+    async def process(
+        self, image: AnyImage, timeout: Optional[float] = None
+    ) -> PreprocessedFrame:
+        return await (await self.submit_async(image, timeout))
+
+    def preprocess(self, image: AnyImage, timeout: Optional[float] = None) -> PreprocessedFrame:
+        future = self._submit(image, True, timeout)
+        if future is None:
+            raise TimeoutError("No free preprocessing slot")
+        return future.result()
+
+    def _submit(
+        self, image: AnyImage, block: bool, timeout: Optional[float] = None
+    ) -> Optional[Future]:
+        try:
+            index = self._free.get(block, timeout)
+        except queue.Empty:
+            return None
+
+        try:
+            shape, dtype, size = self._copy_in(index, image)
+            work = self._pool.submit(
+                _preprocess,
+                self._slots[index].name,
+                size,
+                shape,
+                dtype,
+                self.max_long_edge,
+                self.jpeg_quality,
+                self.thumbnail_size,
+            )
+        except Exception:
+            self._free.put(index)
+            raise
+
+        with self._lock:
+            self.submitted += 1
+        result = Future()
+        work.add_done_callback(lambda done: self._finish(index, done, result))
+        return result
+
+    def in_flight(self) -> int:
+        return len(self._slots) - self._free.qsize()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "slots": len(self._slots),
+                "in_flight": self.in_flight(),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "mean_worker_ms": self.worker_ms / self.completed if self.completed else 0.0,
+            }
+
+    def close(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._slots = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _copy_in(self, index: int, image: AnyImage):
+        if isinstance(image, np.ndarray):
+            image = np.ascontiguousarray(image)
+            shm = self._slot_for(index, image.nbytes)
+            np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+            return image.shape, image.dtype.str, image.nbytes
+
+        if isinstance(image, str):
+            size = os.path.getsize(image)
+            shm = self._slot_for(index, size)
+            with open(image, "rb") as f:
+                f.readinto(shm.buf[:size])
+            return None, None, size
+
+        data = memoryview(image).cast("B")
+        shm = self._slot_for(index, data.nbytes)
+        shm.buf[:data.nbytes] = data
+        return None, None, data.nbytes
+
+    def _slot_for(self, index: int, size: int) -> shared_memory.SharedMemory:
+        shm = self._slots[index]
+        if shm.size < size:
+            # Oversized frame; replace the slot rather than failing
+            logger.info(f"Growing preprocessing slot from {shm.size} to {size} bytes")
+            shm.close()
+            shm.unlink()
+            shm = self._slots[index] = shared_memory.SharedMemory(create=True, size=size)
+        return shm
+
+    def _finish(self, index: int, done: Future, result: Future):
+        try:
+            out, width, height, digest, thumbnail, score, worker_ms = done.result()
+            if isinstance(out, bytes):
+                jpeg = out
+            else:
+                jpeg = bytes(self._slots[index].buf[:out])
+        except BaseException as e:
+            self._free.put(index)
+            result.set_exception(e)
+            return
+
+        self._free.put(index)
+        with self._lock:
+            self.completed += 1
+            self.worker_ms += worker_ms
+        result.set_result(
+            PreprocessedFrame(jpeg, width, height, digest, thumbnail, score, worker_ms)
+        )
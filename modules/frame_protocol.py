@@ -0,0 +1,294 @@
+"""
+Frame protocol v2 shared by the frame servers, the simulator and the firmware.
+
+v1 is the original text protocol: the server sends "GET_FRAME\\n" and the camera
+answers "SIZE <n>\\n" followed by n JPEG bytes.
+
+v2 keeps the text commands but answers with length-prefixed binary chunks.
+Every chunk starts with a CHUNK_HEADER carrying the frame id, capture
+timestamp, total frame size, chunk offset and length, a CRC32 of the chunk, a
+CRC32 of the whole frame and a CRC32 of the header itself. A chunk that fails
+its checksum (or never arrives) is asked for again with
+"RESEND <frame_id> <offset>\\n", so a bad chunk costs one resend from that offset
+instead of a reconnect and a full frame.
+
+Negotiation: a camera that supports v2 says so in its greeting,
+"HELLO <device_id> PROTO=1,2\\n". The server replies "PROTO 2\\n" and the camera
+acknowledges with "PROTO 2\\n". Anything else (no HELLO, no PROTO list, no
+acknowledgement) means v1.
+"""
+
+import socket
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+SUPPORTED_VERSIONS = (PROTOCOL_V1, PROTOCOL_V2)
+
+GET_FRAME = b"GET_FRAME\n"
+
+V2_MAGIC = b"FRM2"
+# magic, frame_id, timestamp_us, total_size, offset, length, chunk_crc, frame_crc, header_crc
+CHUNK_HEADER = struct.Struct("<4sIQIIIIII")
+MAX_CHUNK_SIZE = 64 * 1024
+
+
+class FrameProtocolError(Exception):
+    pass
+
+
+@dataclass
+class ChunkHeader:
+    frame_id: int
+    timestamp_us: int
+    total_size: int
+    offset: int
+    length: int
+    chunk_crc: int
+    frame_crc: int
+
+
+def crc32(data) -> int:
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+def pack_chunk_header(
+    frame_id: int,
+    timestamp_us: int,
+    total_size: int,
+    offset: int,
+    chunk,
+    frame_crc: int,
+) -> bytes:
+    fields = (
+        V2_MAGIC,
+        frame_id,
+        timestamp_us,
+        total_size,
+        offset,
+        len(chunk),
+        crc32(chunk),
+        frame_crc,
+    )
+    header_crc = crc32(CHUNK_HEADER.pack(*fields, 0)[:-4])
+    return CHUNK_HEADER.pack(*fields, header_crc)
+
+
+def unpack_chunk_header(data) -> ChunkHeader:
+    """Parses a chunk header, raising FrameProtocolError if it is not valid."""
+    if len(data) != CHUNK_HEADER.size:
+        raise FrameProtocolError("Truncated chunk header")
+    magic, frame_id, ts, total, offset, length, chunk_crc, frame_crc, header_crc = (
+        CHUNK_HEADER.unpack(data)
+    )
+    if magic != V2_MAGIC:
+        raise FrameProtocolError(f"Bad chunk magic {magic!r}")
+    if crc32(memoryview(data)[:-4]) != header_crc:
+        raise FrameProtocolError("Chunk header checksum mismatch")
+    if length > MAX_CHUNK_SIZE or offset + length > total:
+        raise FrameProtocolError(f"Chunk {offset}+{length} outside frame of {total} bytes")
+    return ChunkHeader(frame_id, ts, total, offset, length, chunk_crc, frame_crc)
+
+
+def hello_line(device_id: str, versions=SUPPORTED_VERSIONS) -> bytes:
+    proto = ",".join(str(v) for v in versions)
+    return f"HELLO {device_id} PROTO={proto}\n".encode("utf-8")
+
+
+def parse_hello_versions(hello_line: str) -> Tuple[int, ...]:
+    """Returns the protocol versions a HELLO line advertises (v1 if none)."""
+    for part in hello_line.split()[2:]:
+        if part.startswith("PROTO="):
+            try:
+                return tuple(int(v) for v in part[len("PROTO="):].split(","))
+            except ValueError:
+                break
+    return (PROTOCOL_V1,)
+
+
+def choose_version(camera_versions) -> int:
+    common = set(camera_versions) & set(SUPPORTED_VERSIONS)
+    return max(common) if common else PROTOCOL_V1
+
+
+def proto_command(version: int) -> bytes:
+    return f"PROTO {version}\n".encode("utf-8")
+
+
+def resend_command(frame_id: int, offset: int) -> bytes:
+    return f"RESEND {frame_id} {offset}\n".encode("utf-8")
+
+
+class ChunkAssembler:
+    """
+    Keeps track of one v2 frame while its chunks arrive.
+
+    It does no I/O itself so the blocking and asyncio servers can share it:
+    the caller reads a header, asks accepts() whether to keep the payload,
+    reads the payload into place and calls verify(). When verify() or the
+    final frame check fails, a chunk is found missing (is_gap()) or the
+    transfer stalls, retry() returns the command to send: a RESEND, or
+    GET_FRAME again if nothing of the frame has been seen yet.
+    """
+
+    def __init__(self, max_retries: int = 3, last_frame_id: Optional[int] = None):
+        self.max_retries = max_retries
+        self.last_frame_id = last_frame_id
+        self.header: Optional[ChunkHeader] = None
+        # Known as soon as any chunk of the frame arrives, even a late one
+        self.frame_id: Optional[int] = None
+        self.next_offset = 0
+        self.retries = 0
+        self.requested_offset = None
+
+    @property
+    def started(self) -> bool:
+        return self.header is not None
+
+    @property
+    def complete(self) -> bool:
+        return self.started and self.next_offset >= self.header.total_size
+
+    def accepts(self, header: ChunkHeader) -> bool:
+        if not self.started:
+            # Leftovers of the previous frame can still be in flight
+            if header.frame_id == self.last_frame_id:
+                return False
+            self.frame_id = header.frame_id
+            if header.offset != 0:
+                # The first chunk went missing; is_gap() reports it
+                return False
+            self.header = header
+            return True
+        # Anything else is from before a RESEND and is skipped
+        return header.frame_id == self.header.frame_id and header.offset == self.next_offset
+
+    def is_gap(self, header: ChunkHeader) -> bool:
+        """True if a chunk of this frame went missing and has not been asked for."""
+        if self.frame_id is None or self.requested_offset == self.next_offset:
+            return False
+        if header.frame_id == self.frame_id:
+            return header.offset > self.next_offset
+        # A later frame is arriving, so the end of this one was lost
+        return self.started and header.frame_id != self.last_frame_id
+
+    def verify(self, header: ChunkHeader, payload) -> bool:
+        if crc32(payload) != header.chunk_crc:
+            return False
+        self.next_offset += header.length
+        return True
+
+    def verify_frame(self, frame) -> bool:
+        return crc32(frame) == self.header.frame_crc
+
+    def retry(self, offset: Optional[int] = None) -> bytes:
+        self.retries += 1
+        if self.retries > self.max_retries:
+            raise FrameProtocolError(
+                f"Frame {self.frame_id} still failing after {self.max_retries} resends"
+            )
+        if self.frame_id is None:
+            if self.last_frame_id is None:
+                # Not a byte of it arrived, and there is no id to resend by
+                return GET_FRAME
+            # The camera numbers frames consecutively
+            self.frame_id = self.last_frame_id + 1
+        self.next_offset = self.next_offset if offset is None else offset
+        self.requested_offset = self.next_offset
+        return resend_command(self.frame_id, self.next_offset)
+
+
+class SocketReader:
+    """
+    Minimal buffered reader over a socket that survives timeouts.
+
+    socket.makefile() readers become unusable after a timeout, which rules out
+    retrying a stalled transfer. Here bytes received before a timeout stay
+    buffered, and large reads still go straight into the caller's buffer.
+    """
+
+    def __init__(self, sock: socket.socket, bufsize: int = 64 * 1024):
+        self.sock = sock
+        self.bufsize = bufsize
+        self._buf = bytearray()
+
+    def _recv(self) -> int:
+        data = self.sock.recv(self.bufsize)
+        self._buf += data
+        return len(data)
+
+    def readline(self) -> bytes:
+        while True:
+            i = self._buf.find(b"\n")
+            if i >= 0:
+                line = bytes(self._buf[: i + 1])
+                del self._buf[: i + 1]
+                return line
+            if not self._recv():
+                line = bytes(self._buf)
+                self._buf.clear()
+                return line
+
+    def readinto(self, view) -> int:
+        if self._buf:
+            n = min(len(view), len(self._buf))
+            view[:n] = self._buf[:n]
+            del self._buf[:n]
+            return n
+        return self.sock.recv_into(view)
+
+    def read(self, size: int) -> bytes:
+        out = bytearray(size)
+        view = memoryview(out)
+        received = 0
+        while received < size:
+            n = self.readinto(view[received:])
+            if not n:
+                break
+            received += n
+        return bytes(out[:received])
+
+    def read_exact_into(self, view):
+        received = 0
+        while received < len(view):
+            n = self.readinto(view[received:])
+            if not n:
+                raise ConnectionError("Connection closed mid-frame")
+            received += n
+
+    def skip(self, size: int):
+        while size > 0:
+            if not self._buf and not self._recv():
+                raise ConnectionError("Connection closed mid-frame")
+            n = min(size, len(self._buf))
+            del self._buf[:n]
+            size -= n
+
+    def read_chunk_header(self) -> ChunkHeader:
+        """Reads the next valid chunk header, skipping any garbage before it."""
+        while True:
+            i = self._buf.find(V2_MAGIC)
+            if i < 0:
+                # Keep a possible partial magic at the end
+                del self._buf[: max(0, len(self._buf) - len(V2_MAGIC) + 1)]
+                if not self._recv():
+                    raise ConnectionError("Connection closed mid-frame")
+                continue
+            del self._buf[:i]
+            while len(self._buf) < CHUNK_HEADER.size:
+                if not self._recv():
+                    raise ConnectionError("Connection closed mid-frame")
+            try:
+                header = unpack_chunk_header(bytes(self._buf[: CHUNK_HEADER.size]))
+            except FrameProtocolError:
+                # Magic bytes inside payload data; keep scanning after them
+                del self._buf[:1]
+                continue
+            del self._buf[: CHUNK_HEADER.size]
+            return header
+
+    def close(self):
+        self._buf.clear()
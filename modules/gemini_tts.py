@@ -1,49 +1,104 @@
 import mimetypes
 import os
+import queue
 import struct
 import logging
+import threading
+from typing import Optional
 from google.genai import types
 from playsound import playsound
 import pyaudio
-import wave
-import io
 import time
 
+from modules.resilience import DeadlineExceeded
+
 logger = logging.getLogger(__name__)
 
+# Audio written to the device per call, so an interrupt takes effect quickly
+WRITE_SECONDS = 0.1
 
-def play_audio_data(audio_data: bytes, sample_rate: int, bits_per_sample: int):
-    p = pyaudio.PyAudio()
+# Downloaded chunks buffered ahead of playback
+MAX_BUFFERED_CHUNKS = 8
+
+
+class PcmOutput:
+    """
+    One output stream kept open for the session.
+
+    Raw PCM is written straight to the device. The stream is only reopened
+    when the sample format changes, so chunks play back to back without
+    paying device-open latency or leaving gaps.
+    """
+
+    def __init__(self, channels: int = 1):
+        self.channels = channels
+        self._pyaudio = None
+        self._stream = None
+        self._format = None
+        self._lock = threading.Lock()
+
+    def write(
+        self,
+        pcm,
+        sample_rate: int,
+        bits_per_sample: int,
+        interrupt: Optional[threading.Event] = None,
+    ) -> bool:
+        """Plays PCM bytes, returning False if interrupt was set before the end."""
+        with self._lock:
+            stream = self._open(sample_rate, bits_per_sample)
+            data = memoryview(pcm)
+            step = max(1, int(sample_rate * WRITE_SECONDS)) * self.channels * (bits_per_sample // 8)
+            for offset in range(0, len(data), step):
+                if interrupt is not None and interrupt.is_set():
+                    return False
+                stream.write(data[offset:offset + step])
+            return True
+
+    def _open(self, sample_rate: int, bits_per_sample: int):
+        audio_format = (sample_rate, bits_per_sample)
+        if self._stream is not None and self._format == audio_format:
+            return self._stream
+        if self._pyaudio is None:
+            self._pyaudio = pyaudio.PyAudio()
+        self._close_stream()
+        self._stream = self._pyaudio.open(
+            format=self._pyaudio.get_format_from_width(bits_per_sample // 8),
+            channels=self.channels,
+            rate=sample_rate,
+            output=True,
+        )
+        self._format = audio_format
+        return self._stream
 
-    # Calculate parameters
-    channels = 1
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
 
-    # Create an in-memory wave file
-    wav_buffer = io.BytesIO()
-    with wave.open(wav_buffer, 'wb') as wav_file:
-        wav_file.setnchannels(channels)
-        wav_file.setsampwidth(bits_per_sample // 8)
-        wav_file.setframerate(sample_rate)
-        wav_file.writeframes(audio_data)
+    def close(self):
+        with self._lock:
+            self._close_stream()
+            if self._pyaudio is not None:
+                self._pyaudio.terminate()
+                self._pyaudio = None
 
-    # Read the wave file for playback
-    wav_buffer.seek(0)
-    with wave.open(wav_buffer, 'rb') as wav_file:
-        stream = p.open(format=p.get_format_from_width(wav_file.getsampwidth()),
-                        channels=wav_file.getnchannels(),
-                        rate=wav_file.getframerate(),
-                        output=True)
 
-        chunk_size = 1024
-        data = wav_file.readframes(chunk_size)
-        while data:
-            stream.write(data)
-            data = wav_file.readframes(chunk_size)
+_output = None
+_output_lock = threading.Lock()
 
-        stream.stop_stream()
-        stream.close()
 
-    p.terminate()
+def get_output() -> PcmOutput:
+    global _output
+    with _output_lock:
+        if _output is None:
+            _output = PcmOutput()
+        return _output
+
+
+def play_audio_data(audio_data: bytes, sample_rate: int, bits_per_sample: int):
+    get_output().write(audio_data, sample_rate, bits_per_sample)
 
 
 # Save to wav file
@@ -64,9 +119,61 @@ def save_binary_file(file_name, data):
             logger.error(f"Error playing audio: {e}")
 
 
-def generate_and_play(client, input_text):
+def generate_and_play(client, input_text, utterance=None, timeout: Optional[float] = None) -> bool:
+    """
+    Streams speech for input_text from Gemini and plays it as it arrives.
+
+    A producer thread downloads chunks while this thread plays the ones
+    already received, so the next chunk is on its way during playback.
+    utterance, if given, is an audio_output.Utterance: playback start is
+    reported on it, and setting its interrupt stops playback (returns False).
+    Raises DeadlineExceeded if no audio has arrived after timeout seconds.
+    """
     generation_start_time = time.time()
+    chunks = queue.Queue(maxsize=MAX_BUFFERED_CHUNKS)
+    interrupt = utterance.interrupt if utterance is not None else None
+    # Tells the producer to give up once playback is over for any reason
+    stop = threading.Event()
 
+    producer = threading.Thread(
+        target=_produce_audio, args=(client, input_text, chunks, stop), daemon=True
+    )
+    producer.start()
+
+    output = get_output()
+    first_chunk = True
+    try:
+        while True:
+            try:
+                item = chunks.get(timeout=0.1)
+            except queue.Empty:
+                if interrupt is not None and interrupt.is_set():
+                    return False
+                if first_chunk and timeout is not None and time.time() - generation_start_time > timeout:
+                    raise DeadlineExceeded(f"No speech from Gemini within {timeout:.1f}s")
+                continue
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if first_chunk:
+                print("Time to first audio: %.2f seconds" % (time.time() - generation_start_time))
+                first_chunk = False
+                if utterance is not None:
+                    utterance.mark_started()
+            data, mime_type = item
+            parameters = parse_audio_mime_type(mime_type)
+            if not output.write(data, parameters["rate"], parameters["bits_per_sample"], interrupt):
+                return False
+    finally:
+        stop.set()
+
+    print("Total generation and playback time: %.2f seconds" % (time.time() - generation_start_time))
+    return interrupt is None or not interrupt.is_set()
+
+
+def _produce_audio(client, input_text, chunks: queue.Queue, stop: threading.Event):
+    """Puts (PCM bytes, mime type) items on chunks, then None or the error."""
     model = "gemini-2.5-flash-preview-tts"
     contents = [
         types.Content(
@@ -90,44 +197,40 @@ def generate_and_play(client, input_text):
         )
     )
 
-    file_index = 0
-    for chunk in client.models.generate_content_stream(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-    ):
-        print("Generation time: %.2f seconds" % (time.time() - generation_start_time))
-        processing_start_time = time.time()
-        if (
-                chunk.candidates is None
-                or chunk.candidates[0].content is None
-                or chunk.candidates[0].content.parts is None
+    try:
+        for chunk in client.models.generate_content_stream(
+                model=model,
+                contents=contents,
+                config=generate_content_config,
         ):
-            continue
-        if chunk.candidates[0].content.parts[0].inline_data and chunk.candidates[0].content.parts[0].inline_data.data:
-            # file_name = f"test_{file_index}"
-            file_index += 1
+            if stop.is_set():
+                break
+            if (
+                    chunk.candidates is None
+                    or chunk.candidates[0].content is None
+                    or chunk.candidates[0].content.parts is None
+            ):
+                continue
             inline_data = chunk.candidates[0].content.parts[0].inline_data
-            data_buffer = inline_data.data
-
-            # file_extension = mimetypes.guess_extension(inline_data.mime_type)
-            # if file_extension is None:
-            #     file_extension = ".wav"
-            #     data_buffer = convert_to_wav(inline_data.data, inline_data.mime_type)
-            # save_binary_file(f"{file_name}{file_extension}", data_buffer)
+            if inline_data and inline_data.data:
+                # audio/L16 is headerless PCM and goes to the device as it is
+                _put(chunks, (inline_data.data, inline_data.mime_type), stop)
+            else:
+                logger.info(chunk.text)
+    except Exception as e:
+        _put(chunks, e, stop)
+        return
+    _put(chunks, None, stop)
 
-            parameters = parse_audio_mime_type(inline_data.mime_type)
 
-            print("Processing time: %.2f seconds" % (time.time() - processing_start_time))
-            playback_start_time = time.time()
-            if inline_data.mime_type.startswith('audio/L'):
-                wav_data = convert_to_wav(data_buffer, inline_data.mime_type)
-                play_audio_data(wav_data[44:], parameters['rate'], parameters['bits_per_sample'])  # Skip WAV header
-            else:
-                play_audio_data(data_buffer, parameters['rate'], parameters['bits_per_sample'])
-            print("Playback time: %.2f seconds" % (time.time() - playback_start_time))
-        else:
-            logger.info(chunk.text)
+def _put(chunks: queue.Queue, item, stop: threading.Event):
+    # Blocks while playback is behind, but gives up once playback has stopped
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
 
 
 def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
@@ -0,0 +1,73 @@
+import os
+from typing import Iterator, Optional
+
+from google import genai
+from google.genai import types
+
+from modules.vision import VisionProvider
+
+GEMINI_VISION_MODEL = "gemini-2.5-flash"
+
+
+class GeminiVisionProvider(VisionProvider):
+    """Image descriptions from Gemini, using the same key as gemini_tts."""
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = None, model: str = GEMINI_VISION_MODEL):
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "Gemini API key is required. Set GEMINI_API_KEY environment variable or pass it directly."
+            )
+        self.model = model
+        super().__init__()
+        self.client = genai.Client(api_key=api_key)
+
+    def describe(self, jpeg, prompt, max_tokens=None, timeout=None) -> str:
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=self._contents(jpeg, prompt),
+            config=self._config(max_tokens, timeout),
+        )
+        return _response_text(response)
+
+    async def describe_async(self, jpeg, prompt, max_tokens=None, timeout=None) -> str:
+        response = await self.client.aio.models.generate_content(
+            model=self.model,
+            contents=self._contents(jpeg, prompt),
+            config=self._config(max_tokens, timeout),
+        )
+        return _response_text(response)
+
+    def stream(self, jpeg, prompt, max_tokens=None, timeout=None) -> Iterator[str]:
+        for chunk in self.client.models.generate_content_stream(
+            model=self.model,
+            contents=self._contents(jpeg, prompt),
+            config=self._config(max_tokens, timeout),
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    def _contents(self, jpeg, prompt: str) -> list:
+        return [
+            types.Part.from_bytes(data=bytes(jpeg), mime_type="image/jpeg"),
+            prompt,
+        ]
+
+    def _config(self, max_tokens: Optional[int], timeout: Optional[float]):
+        return types.GenerateContentConfig(
+            max_output_tokens=max_tokens,
+            # Descriptions don't need the model to think first
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)) if timeout else None,
+        )
+
+
+def _response_text(response) -> str:
+    text = response.text
+    if not text:
+        # Blocked by a safety filter, or out of tokens before any text
+        reason = response.candidates[0].finish_reason if response.candidates else None
+        raise RuntimeError(f"Gemini returned no description (finish reason {reason})")
+    return text
@@ -0,0 +1,186 @@
+import hashlib
+import time
+from typing import List, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+# A path to an image on disk, encoded image bytes (e.g. a frame buffer view),
+# or an already decoded OpenCV/NumPy image
+AnyImage = Union[str, bytes, bytearray, memoryview, np.ndarray]
+
+
+def load_image(image: AnyImage, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """Decodes any supported image input into a NumPy array."""
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, str):
+        decoded = cv2.imread(image, flags)
+    else:
+        decoded = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flags)
+    if decoded is None:
+        raise ValueError("Could not decode image")
+    return decoded
+
+
+def content_digest(image: AnyImage) -> str:
+    """Hex digest of the image's bytes, as given (encoded or decoded)."""
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            return hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+    if isinstance(image, np.ndarray):
+        image = np.ascontiguousarray(image)
+    return hashlib.blake2b(memoryview(image).cast("B"), digest_size=16).hexdigest()
+
+
+def to_grayscale(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def gray_thumbnail(image: AnyImage, size: Tuple[int, int] = (32, 24)) -> np.ndarray:
+    """
+    Returns a small float32 grayscale version of the image.
+
+    Encoded JPEGs are decoded at 1/8 scale straight into grayscale, which is
+    much cheaper than a full decode when only a thumbnail is needed.
+    """
+    if isinstance(image, np.ndarray):
+        gray = to_grayscale(image)
+    else:
+        gray = load_image(image, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def sharpness(image: np.ndarray, max_long_edge: int = 320) -> float:
+    """
+    Variance of the Laplacian of a downscaled grayscale copy of the image.
+
+    Motion blur removes high frequencies, so a blurry frame scores lower than
+    a sharp frame of the same scene. The 4-neighbour Laplacian is computed
+    with array slices, and downscaling first keeps it to a few milliseconds.
+    """
+    gray = resize_long_edge(to_grayscale(image), max_long_edge).astype(np.float32)
+    laplacian = (
+        gray[1:-1, :-2]
+        + gray[1:-1, 2:]
+        + gray[:-2, 1:-1]
+        + gray[2:, 1:-1]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def pick_sharpest(frames: Sequence[np.ndarray]) -> Tuple[int, List[float], float]:
+    """
+    Scores each frame with sharpness().
+
+    Returns the index of the sharpest frame, all scores, and the scoring time
+    per frame in milliseconds.
+    """
+    start = time.perf_counter()
+    scores = [sharpness(frame) for frame in frames]
+    ms_per_frame = (time.perf_counter() - start) * 1000 / max(1, len(frames))
+    return int(np.argmax(scores)), scores, ms_per_frame
+
+
+def resize_long_edge(image: np.ndarray, max_long_edge: int) -> np.ndarray:
+    height, width = image.shape[:2]
+    long_edge = max(height, width)
+    if long_edge <= max_long_edge:
+        return image
+    scale = max_long_edge / long_edge
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 80) -> np.ndarray:
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode image as JPEG")
+    return encoded
+
+
+def jpeg_size(data) -> Optional[Tuple[int, int]]:
+    """Reads (width, height) from a JPEG's SOF marker without decoding it."""
+    view = memoryview(data)
+    if view[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(view):
+        if view[i] != 0xFF:
+            return None
+        marker = view[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        length = (view[i + 2] << 8) | view[i + 3]
+        # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (view[i + 5] << 8) | view[i + 6]
+            width = (view[i + 7] << 8) | view[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+# IMREAD_REDUCED_* flags let libjpeg decode straight to 1/2, 1/4 or 1/8 size
+_REDUCED_COLOR_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def load_image_reduced(
+    data,
+    max_long_edge: Optional[int],
+    size: Optional[Tuple[int, int]] = None,
+) -> np.ndarray:
+    """
+    Decodes encoded image bytes at the smallest JPEG scale that still leaves
+    at least max_long_edge pixels on the long edge.
+    """
+    size = size or jpeg_size(data)
+    flags = cv2.IMREAD_COLOR
+    if size and max_long_edge is not None:
+        for factor, reduced_flags in _REDUCED_COLOR_FLAGS:
+            if max(size) // factor >= max_long_edge:
+                flags = reduced_flags
+                break
+    return load_image(data, flags)
+
+
+def prepare_jpeg(
+    image: AnyImage,
+    max_long_edge: Optional[int] = None,
+    quality: int = 80,
+):
+    """
+    Returns JPEG bytes (or a bytes-like view) ready to upload.
+
+    Images larger than max_long_edge are downscaled and re-encoded at
+    `quality`; decoded arrays are always encoded. Encoded input that is
+    already small enough is passed through untouched, so it is not decoded or
+    recompressed a second time. Large JPEGs are decoded at a reduced scale
+    when that still leaves at least max_long_edge pixels.
+    """
+    if isinstance(image, str):
+        with open(image, "rb") as f:
+            image = f.read()
+
+    if not isinstance(image, np.ndarray):
+        if max_long_edge is None:
+            return image
+        size = jpeg_size(image)
+        if size and max(size) <= max_long_edge:
+            return image
+        image = load_image_reduced(image, max_long_edge, size)
+
+    if max_long_edge is not None:
+        image = resize_long_edge(image, max_long_edge)
+    return memoryview(encode_jpeg(image, quality))
@@ -0,0 +1,234 @@
+import glob
+import logging
+import os
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATES_DIR = "keyword_templates"
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 400  # 25 ms
+FRAME_STEP = 160  # 10 ms
+FFT_SIZE = 512
+MEL_FILTERS = 26
+MFCC_COEFFICIENTS = 13
+
+
+def _mel_filterbank() -> np.ndarray:
+    def to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    mels = np.linspace(to_mel(0), to_mel(SAMPLE_RATE / 2), MEL_FILTERS + 2)
+    bins = np.floor((FFT_SIZE + 1) * to_hz(mels) / SAMPLE_RATE).astype(int)
+    bank = np.zeros((MEL_FILTERS, FFT_SIZE // 2 + 1), dtype=np.float32)
+    for i in range(MEL_FILTERS):
+        left, center, right = bins[i], bins[i + 1], bins[i + 2]
+        bank[i, left:center] = (np.arange(left, center) - left) / max(1, center - left)
+        bank[i, center:right] = (right - np.arange(center, right)) / max(1, right - center)
+    return bank
+
+
+def _dct_matrix() -> np.ndarray:
+    n = np.arange(MEL_FILTERS)
+    k = np.arange(MFCC_COEFFICIENTS)[:, None]
+    return np.cos(np.pi * k * (2 * n + 1) / (2 * MEL_FILTERS)).astype(np.float32)
+
+
+_MEL_FILTERBANK = _mel_filterbank()
+_DCT = _dct_matrix()
+_WINDOW = np.hamming(FRAME_LENGTH).astype(np.float32)
+
+
+def pcm_samples(audio: sr.AudioData) -> np.ndarray:
+    """The recording as 16 kHz mono int16 samples."""
+    raw = audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2)
+    return np.frombuffer(raw, dtype=np.int16)
+
+
+def _frames(samples: np.ndarray) -> np.ndarray:
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+    count = 1 + (len(samples) - FRAME_LENGTH) // FRAME_STEP
+    return np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::FRAME_STEP][:count]
+
+
+def frame_energy(samples: np.ndarray) -> np.ndarray:
+    """RMS of each 25 ms frame, on the same scale as Recognizer.energy_threshold."""
+    frames = _frames(samples).astype(np.float32)
+    return np.sqrt((frames * frames).mean(axis=1))
+
+
+def mfcc(samples: np.ndarray) -> np.ndarray:
+    """(frames, 13) MFCCs with the per-utterance mean removed."""
+    frames = _frames(samples).astype(np.float32) * _WINDOW
+    power = np.abs(np.fft.rfft(frames, FFT_SIZE)) ** 2 / FFT_SIZE
+    features = np.log(power @ _MEL_FILTERBANK.T + 1e-6) @ _DCT.T
+    return features - features.mean(axis=0)
+
+
+def dtw_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """Dynamic time warping distance of two feature sequences, per step."""
+    cost = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+    n, m = cost.shape
+    total = np.full((n + 1, m + 1), np.inf)
+    total[0, 0] = 0.0
+    for i in range(1, n + 1):
+        row_cost = cost[i - 1]
+        previous = total[i - 1]
+        best = np.minimum(previous[:-1], previous[1:]) + row_cost
+        # Horizontal moves chain along the row: row[j] is the cheapest
+        # best[k] plus the cost of columns k+1..j, a running minimum once
+        # written with the row's cumulative cost
+        cumulative = np.cumsum(row_cost)
+        total[i, 1:] = cumulative + np.minimum.accumulate(best - cumulative)
+    return float(total[n, m] / (n + m))
+
+
+class KeywordSpotter:
+    """
+    Recognizes a few command words on the device, ahead of cloud speech
+    recognition.
+
+    A phrase first goes through an energy-based voice activity check: the
+    frames louder than the energy threshold must add up to a word-length
+    stretch, so silence, clicks and long background conversations are
+    dropped at once. The voiced part is then compared by dynamic time
+    warping of MFCCs against templates of each keyword recorded with
+    enroll() (see scripts/enrollKeywords.py). Until a keyword has templates,
+    command() falls back to recognize_google for phrases that pass the
+    voice check.
+
+    Args:
+        keywords: The command words to listen for.
+        templates_dir: Where enrolled templates are kept.
+        max_distance: DTW distance above which nothing matches.
+        single_max_distance: Stricter max_distance used when listening for
+                             a single keyword, as no other keyword's
+                             templates compete for the phrase.
+        min_speech: Shortest voiced stretch (seconds) that can be a command.
+        max_speech: Longest voiced stretch (seconds) that can be a command.
+        energy_threshold: Frame RMS that counts as speech, unless command()
+                          is given a recognizer, whose threshold is used.
+    """
+
+    def __init__(
+        self,
+        keywords: Sequence[str] = ("snapshot", "recall", "more"),
+        templates_dir: str = DEFAULT_TEMPLATES_DIR,
+        max_distance: float = 12.0,
+        single_max_distance: float = 9.0,
+        min_speech: float = 0.2,
+        max_speech: float = 2.0,
+        energy_threshold: float = 300.0,
+    ):
+        self.keywords = tuple(keywords)
+        self.templates_dir = templates_dir
+        self.max_distance = max_distance
+        self.single_max_distance = single_max_distance
+        self.min_speech = min_speech
+        self.max_speech = max_speech
+        self.energy_threshold = energy_threshold
+        self.templates: Dict[str, List[np.ndarray]] = {}
+        self.local_matches = 0
+        self.cloud_calls = 0
+        self.rejected = 0
+        self.last_distance: Optional[float] = None
+        self._load_templates()
+
+    @property
+    def enrolled(self) -> bool:
+        return all(self.templates.get(keyword) for keyword in self.keywords)
+
+    def command(
+        self, audio: sr.AudioData, recognizer: Optional[sr.Recognizer] = None
+    ) -> Optional[str]:
+        """
+        Returns the keyword spoken in the phrase, or None.
+
+        Only falls back to the cloud when keywords aren't enrolled, in which
+        case sr.RequestError from recognize_google is passed on.
+        """
+        threshold = recognizer.energy_threshold if recognizer is not None else self.energy_threshold
+        voiced = self.voiced_samples(pcm_samples(audio), threshold)
+        if voiced is None:
+            self.rejected += 1
+            return None
+
+        if self.enrolled:
+            keyword, self.last_distance = self.match(voiced)
+            if keyword is None:
+                self.rejected += 1
+            else:
+                self.local_matches += 1
+            return keyword
+
+        if recognizer is None:
+            return None
+        self.cloud_calls += 1
+        try:
+            text = recognizer.recognize_google(audio).lower()
+        except sr.UnknownValueError:
+            return None
+        logger.info(f"Heard: {text}")
+        # Substring match, as before on-device spotting, so "snapshots" or
+        # "snapshot." still count
+        return next((keyword for keyword in self.keywords if keyword in text), None)
+
+    def voiced_samples(self, samples: np.ndarray, energy_threshold: float) -> Optional[np.ndarray]:
+        """Samples from the first to the last voiced frame; None unless word-length."""
+        voiced = np.flatnonzero(frame_energy(samples) > energy_threshold)
+        if len(voiced) == 0:
+            return None
+        seconds = len(voiced) * FRAME_STEP / SAMPLE_RATE
+        if not self.min_speech <= seconds <= self.max_speech:
+            return None
+        return samples[voiced[0] * FRAME_STEP:voiced[-1] * FRAME_STEP + FRAME_LENGTH]
+
+    def match(self, samples: np.ndarray) -> Tuple[Optional[str], float]:
+        """Closest keyword and its DTW distance; keyword is None if too far."""
+        features = mfcc(samples)
+        best, best_distance = None, float("inf")
+        for keyword, templates in self.templates.items():
+            for template in templates:
+                distance = dtw_distance(features, template)
+                if distance < best_distance:
+                    best, best_distance = keyword, distance
+        limit = self.max_distance if len(self.keywords) > 1 else self.single_max_distance
+        if best_distance > limit:
+            return None, best_distance
+        return best, best_distance
+
+    def enroll(
+        self, keyword: str, audio: sr.AudioData, energy_threshold: Optional[float] = None
+    ) -> bool:
+        """Adds a recording of the keyword as a template; False if no word was heard."""
+        threshold = self.energy_threshold if energy_threshold is None else energy_threshold
+        voiced = self.voiced_samples(pcm_samples(audio), threshold)
+        if voiced is None:
+            return False
+        templates = self.templates.setdefault(keyword, [])
+        templates.append(mfcc(voiced))
+        os.makedirs(self.templates_dir, exist_ok=True)
+        np.save(os.path.join(self.templates_dir, f"{keyword}_{len(templates)}.npy"), templates[-1])
+        return True
+
+    def _load_templates(self):
+        for keyword in self.keywords:
+            paths = sorted(glob.glob(os.path.join(self.templates_dir, f"{keyword}_*.npy")))
+            if paths:
+                self.templates[keyword] = [np.load(path) for path in paths]
+
+    def stats(self) -> dict:
+        return {
+            "local_matches": self.local_matches,
+            "cloud_calls": self.cloud_calls,
+            "rejected": self.rejected,
+            "enrolled": sorted(self.templates),
+        }
@@ -1,6 +1,8 @@
 import speech_recognition as sr
 import logging
 
+from modules.keyword_spotter import KeywordSpotter
+from modules.noise_calibration import NoiseCalibration
 from modules.speak import speak
 
 logger = logging.getLogger(__name__)
@@ -14,10 +16,9 @@ def list_microphone_names():
 def listen_for_query(is_activated) -> str:
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
-
-    with mic as source:
-        speak("Adjusting for ambient noise... Please wait.")
-        recognizer.adjust_for_ambient_noise(source)
+    calibration = NoiseCalibration()
+    # Loaded from disk, so entering query mode doesn't stop to calibrate
+    calibration.prepare(recognizer, mic)
 
     speak("Listening for your query...")
 
@@ -29,6 +30,7 @@ def listen_for_query(is_activated) -> str:
             except sr.WaitTimeoutError:
                 speak("Sorry, I didn't hear anything. Please try again.")
                 continue
+        calibration.remember(mic, recognizer.energy_threshold)
 
         try:
             command = recognizer.recognize_google(audio).lower()
@@ -48,22 +50,19 @@ def listen_for_query(is_activated) -> str:
 def listen_for_snapshot_pi(camera_manager, cohere_analyzer):
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
-
-    with mic as source:
-        print("Adjusting for ambient noise... Please wait.")
-        recognizer.adjust_for_ambient_noise(source)
+    keyword_spotter = KeywordSpotter(("snapshot",))
+    calibration = NoiseCalibration()
+    calibration.prepare(recognizer, mic)
 
     print("Listening for the word 'snapshot'...")
 
     while True:
         with mic as source:
             audio = recognizer.listen(source)
+        calibration.remember(mic, recognizer.energy_threshold)
 
         try:
-            command = recognizer.recognize_google(audio).lower()
-            print(f"Heard: {command}")
-
-            if "snapshot" in command:
+            if keyword_spotter.command(audio, recognizer) == "snapshot":
                 print("Taking photo")
                 speak("Taking photo")
 
@@ -80,25 +79,22 @@ def listen_for_snapshot_pi(camera_manager, cohere_analyzer):
 def listen_for_snapshot(camera_manager):
     recognizer = sr.Recognizer()
     mic = sr.Microphone()
-
-    with mic as source:
-        logger.info("Adjusting for ambient noise... Please wait.")
-        recognizer.adjust_for_ambient_noise(source)
+    keyword_spotter = KeywordSpotter(("snapshot",))
+    calibration = NoiseCalibration()
+    calibration.prepare(recognizer, mic)
 
     logger.info("Listening for the word 'snapshot'...")
 
     while True:
         with mic as source:
             audio = recognizer.listen(source)
+        calibration.remember(mic, recognizer.energy_threshold)
 
         try:
-            command = recognizer.recognize_google(audio).lower()
-            logger.info(f"Heard: {command}")
-
-            if "snapshot" in command:
+            if keyword_spotter.command(audio, recognizer) == "snapshot":
                 logger.info("Taking snapshot")
                 speak("Taking snapshot")
-                result = camera_manager.take_snapshot()
+                result = camera_manager.take_snapshot(burst_size=3)
 
                 if result:
                     if isinstance(result, tuple):
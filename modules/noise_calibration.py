@@ -0,0 +1,111 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CALIBRATION_PATH = "noise_calibration.json"
+
+
+def microphone_name(microphone: sr.Microphone) -> str:
+    if microphone.device_index is None:
+        return "default"
+    return _device_name(microphone.device_index)
+
+
+@functools.lru_cache(maxsize=None)
+def _device_name(device_index: int) -> str:
+    # Listing devices starts up PortAudio, so it's only done once per device
+    try:
+        return sr.Microphone.list_microphone_names()[device_index]
+    except (IndexError, OSError):
+        return f"device {device_index}"
+
+
+class NoiseCalibration:
+    """
+    Energy thresholds saved per microphone, so listening can start without
+    the ~1 s blocking adjust_for_ambient_noise().
+
+    The threshold is only measured that way the first time a microphone is
+    used. After that the saved value is loaded at startup and kept up to
+    date from the background noise while listening (the recognizer's
+    dynamic threshold, or AudioCapture's), and remember() writes it back.
+
+    Args:
+        path: JSON file with one threshold per microphone name.
+        save_interval: Minimum seconds between writes of a changed threshold.
+    """
+
+    def __init__(self, path: str = DEFAULT_CALIBRATION_PATH, save_interval: float = 60.0):
+        self.path = path
+        self.save_interval = save_interval
+        self.thresholds: Dict[str, float] = {}
+        self._saved_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.thresholds = {name: float(value) for name, value in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable noise calibration {path}: {e}")
+
+    def threshold(self, microphone: sr.Microphone) -> Optional[float]:
+        return self.thresholds.get(microphone_name(microphone))
+
+    def prepare(self, recognizer: sr.Recognizer, microphone: sr.Microphone) -> float:
+        """
+        Sets the recognizer's energy threshold for the microphone, from the
+        saved value or, the first time, by measuring the ambient noise.
+        """
+        saved = self.threshold(microphone)
+        if saved is not None:
+            recognizer.energy_threshold = saved
+        else:
+            with microphone as source:
+                print("Adjusting for ambient noise... Please wait.")
+                recognizer.adjust_for_ambient_noise(source)
+            self.remember(microphone, recognizer.energy_threshold, force=True)
+        # Keeps following the noise floor between phrases
+        recognizer.dynamic_energy_threshold = True
+        return recognizer.energy_threshold
+
+    def remember(self, microphone: sr.Microphone, threshold: float, force: bool = False):
+        """Records the current threshold; written out at most every save_interval."""
+        with self._lock:
+            self.thresholds[microphone_name(microphone)] = float(threshold)
+            self._dirty = True
+            if not force and time.monotonic() - self._saved_at < self.save_interval:
+                return
+        self.save()
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            temp_path = None
+            try:
+                fd, temp_path = tempfile.mkstemp(suffix=".part", dir=directory)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(self.thresholds, f, indent=2)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                # Called from the capture thread, which must keep running
+                if temp_path is not None:
+                    with contextlib.suppress(OSError):
+                        os.unlink(temp_path)
+                logger.warning(f"Couldn't save noise calibration: {e}")
+                return
+            self._dirty = False
+            self._saved_at = time.monotonic()
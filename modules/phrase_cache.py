@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "tts_cache"
+
+
+class PhraseCache:
+    """
+    Persistent cache of synthesized speech, one audio file per phrase.
+
+    Files are named by a hash of the text, language and voice, so a phrase
+    spoken before plays straight from disk, without the network. A file's
+    modification time is its last use; beyond max_entries files the least
+    recently used are deleted.
+
+    Args:
+        directory: Where the audio files are kept.
+        max_entries: Files kept before the least recently used are evicted.
+        suffix: File extension of the synthesized audio.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_entries: int = 500,
+        suffix: str = ".mp3",
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, text: str, lang: str = "en", voice: str = "") -> str:
+        key = hashlib.blake2b(
+            f"{lang}\0{voice}\0{text.strip()}".encode("utf-8"), digest_size=16
+        ).hexdigest()
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, text: str, lang: str = "en", voice: str = "") -> Optional[str]:
+        """Returns the cached audio file for the phrase, or None."""
+        path = self.path(text, lang, voice)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get_or_create(
+        self,
+        text: str,
+        synthesize: Callable[[str], None],
+        lang: str = "en",
+        voice: str = "",
+    ) -> str:
+        """
+        Returns the cached audio file for the phrase, calling synthesize(path)
+        to write it first on a miss.
+        """
+        path = self.get(text, lang, voice)
+        if path is not None:
+            return path
+        path = self.path(text, lang, voice)
+        # Synthesize next to the final file and rename, so a reader never
+        # sees a half-written file and an interrupted write leaves nothing
+        fd, temp_path = tempfile.mkstemp(suffix=".part", dir=self.directory)
+        os.close(fd)
+        try:
+            synthesize(temp_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self._evict()
+        return path
+
+    def warm_up(
+        self,
+        phrases: Iterable[str],
+        synthesize: Callable[[str, str], None],
+        lang: str = "en",
+        voice: str = "",
+    ) -> int:
+        """
+        Synthesizes the phrases that aren't cached yet with
+        synthesize(text, path). Returns how many were added; phrases that
+        fail (e.g. while offline) are skipped.
+        """
+        added = 0
+        for text in phrases:
+            if os.path.exists(self.path(text, lang, voice)):
+                continue
+            try:
+                self.get_or_create(text, lambda path: synthesize(text, path), lang, voice)
+                added += 1
+            except Exception as e:
+                logger.warning(f"Couldn't pre-synthesize {text!r}: {e}")
+        return added
+
+    def _evict(self):
+        with self._lock:
+            entries = [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(self.suffix) and entry.is_file()
+            ]
+            excess = len(entries) - self.max_entries
+            if excess <= 0:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:excess]:
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+            logger.info(f"Evicted {excess} cached phrases")
+
+    def __len__(self) -> int:
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(self.suffix))
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(self.suffix):
+                    os.unlink(os.path.join(self.directory, name))
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "entries": len(self),
+        }
@@ -1,10 +1,16 @@
-from typing import Optional
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
 
+import cv2
 from picamera2 import Picamera2, Preview
 import time
 import os
 from libcamera import Transform
 
+from modules.image_utils import pick_sharpest
+
 
 class PiCameraManager:
     def __init__(self, save_dir="images"):
@@ -57,6 +63,36 @@ class PiCameraManager:
             print(f"Error taking photo: {e}")
             return False
 
+    def take_burst_photo(self, burst_size=5):
+        """Captures burst_size frames and saves only the sharpest one."""
+        if not self.cam:
+            print("Error: Camera not started")
+            return False
+
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        photo_path = os.path.join(self.save_dir, f"snapshot_{timestamp}.jpg")
+
+        try:
+            frames = [self.cam.capture_array("main") for _ in range(burst_size)]
+            best, scores, ms_per_frame = pick_sharpest(frames)
+            print(
+                f"Picked frame {best + 1}/{burst_size} (sharpness {scores[best]:.0f}, "
+                f"scoring {ms_per_frame:.2f} ms/frame)"
+            )
+
+            frame = frames[best]
+            if frame.ndim == 3 and frame.shape[2] == 4:
+                # The default preview format is XBGR8888; JPEG has no alpha
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+            if not cv2.imwrite(photo_path, frame):
+                raise RuntimeError(f"Could not write {photo_path}")
+            self.saved_photo_path = photo_path
+            print(f"Photo saved to {photo_path}")
+            return True
+        except Exception as e:
+            print(f"Error taking photo: {e}")
+            return False
+
     def analyze_photo(self, cohere_analyzer) -> Optional[str]:
         if not self.saved_photo_path or not cohere_analyzer:
             return None
@@ -85,3 +121,180 @@ class PiCameraManager:
             return "Failed to take photo"
 
 
+class PiCameraService:
+    """
+    Long-lived camera that stays warm between snapshots.
+
+    Building and configuring Picamera2 takes seconds, so instead of doing it
+    for every snapshot the sensor keeps running at a low preview resolution
+    and a background thread copies frames into a ring buffer of the most
+    recent `buffer_size` frames. snapshot() returns the newest of those
+    immediately; a full-resolution still is only taken when asked for.
+    """
+
+    def __init__(
+        self,
+        save_dir="images",
+        buffer_size=8,
+        preview_size=(1280, 720),
+        frame_interval=0.1,
+    ):
+        self.save_dir = save_dir
+        self.preview_size = preview_size
+        self.frame_interval = frame_interval
+        self.cam = None
+        self.still_config = None
+        self.frames = deque(maxlen=buffer_size)  # (timestamp, frame) pairs
+        self.saved_photo = None
+        self.saved_photo_path = None
+        self.last_scoring_ms = None
+        self._cam_lock = threading.Lock()
+        self._frames_lock = threading.Lock()
+        self._running = threading.Event()
+        self._thread = None
+        self._saver = None
+
+    def start_camera(self):
+        if self._running.is_set():
+            return True
+        try:
+            os.makedirs(self.save_dir, exist_ok=True)
+            self.cam = Picamera2()
+
+            transform = Transform(vflip=True, hflip=True)
+            preview_config = self.cam.create_preview_configuration(
+                main={"size": self.preview_size, "format": "RGB888"},
+                transform=transform,
+            )
+            self.still_config = self.cam.create_still_configuration(
+                main={"format": "RGB888"}, transform=transform
+            )
+            self.cam.configure(preview_config)
+            self.cam.start()
+
+            self._saver = ThreadPoolExecutor(max_workers=1)
+            self._running.set()
+            self._thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self._thread.start()
+            return True
+        except Exception as e:
+            print(f"Error starting camera: {e}")
+            return False
+
+    def stop_camera(self):
+        self._running.clear()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+        if self.cam:
+            with self._cam_lock:
+                self.cam.close()
+            self.cam = None
+        if self._saver:
+            self._saver.shutdown(wait=True)
+            self._saver = None
+
+    def _capture_loop(self):
+        while self._running.is_set():
+            try:
+                with self._cam_lock:
+                    frame = self.cam.capture_array("main")
+            except Exception as e:
+                print(f"Error capturing frame: {e}")
+                time.sleep(0.5)
+                continue
+
+            with self._frames_lock:
+                self.frames.append((time.time(), frame))
+            time.sleep(self.frame_interval)
+
+    def recent_frames(self):
+        with self._frames_lock:
+            return list(self.frames)
+
+    def latest_frame(self, timeout=2.0):
+        """Returns the newest buffered frame, waiting briefly if there is none yet."""
+        deadline = time.time() + timeout
+        while True:
+            frames = self.recent_frames()
+            if frames:
+                return frames[-1][1]
+            if time.time() > deadline or not self._running.is_set():
+                return None
+            time.sleep(0.01)
+
+    def sharpest_recent_frame(self, burst_size=5):
+        """
+        Returns the sharpest of the last burst_size buffered frames. The ring
+        buffer already holds them, so a burst costs only the scoring time.
+        """
+        if self.latest_frame() is None:
+            return None
+        frames = [frame for _, frame in self.recent_frames()[-burst_size:]]
+        best, scores, self.last_scoring_ms = pick_sharpest(frames)
+        print(
+            f"Picked frame {best + 1}/{len(frames)} (sharpness {scores[best]:.0f}, "
+            f"scoring {self.last_scoring_ms:.2f} ms/frame)"
+        )
+        return frames[best]
+
+    def snapshot(self, full_resolution=False, burst_size=1):
+        """Returns a frame as a BGR NumPy array, or None if none is available.
+
+        With burst_size > 1 the sharpest of the most recent frames is used.
+        """
+        if not self.cam:
+            print("Error: Camera not started")
+            return None
+        if not full_resolution:
+            if burst_size > 1:
+                return self.sharpest_recent_frame(burst_size)
+            return self.latest_frame()
+
+        try:
+            with self._cam_lock:
+                return self.cam.switch_mode_and_capture_array(self.still_config, "main")
+        except Exception as e:
+            print(f"Error taking full resolution photo: {e}")
+            return None
+
+    def take_photo(self, full_resolution=False, save=True, burst_size=5):
+        frame = self.snapshot(full_resolution, burst_size)
+        if frame is None:
+            return False
+
+        self.saved_photo = frame
+        self.saved_photo_path = None
+        if save:
+            timestamp = time.strftime("%Y%m%d-%H%M%S")
+            photo_path = os.path.join(self.save_dir, f"snapshot_{timestamp}.jpg")
+            # Written in the background; analysis uses the in-memory frame
+            self._saver.submit(cv2.imwrite, photo_path, frame)
+            self.saved_photo_path = photo_path
+            print(f"Photo saved to {photo_path}")
+        return True
+
+    def analyze_photo(self, cohere_analyzer) -> Optional[str]:
+        if self.saved_photo is None or not cohere_analyzer:
+            return None
+
+        try:
+            print("Analyzing image with Cohere...")
+            description = cohere_analyzer.describe_image_for_blind_person(
+                self.saved_photo
+            )
+            print(f"Image description: {description}")
+            return description
+        except Exception as e:
+            print(f"Error analyzing image: {e}")
+            return None
+
+    def analyze_photo_stream(self, cohere_analyzer) -> Iterator[str]:
+        """Yields the description of the last photo a sentence at a time."""
+        if self.saved_photo is None or not cohere_analyzer:
+            return
+
+        print("Analyzing image with Cohere...")
+        for sentence in cohere_analyzer.describe_image_stream(self.saved_photo):
+            print(f"Image description: {sentence}")
+            yield sentence
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Awaitable, Callable, Deque, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a remote service keeps failing.
+
+    After failure_threshold consecutive failures the circuit opens and
+    check() raises CircuitOpenError without calling the service. Once
+    reset_timeout seconds have passed a single trial call is let through
+    (half-open); its success closes the circuit, a failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str = "", failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name or 'Service'} is unavailable")
+                self.state = self.HALF_OPEN
+                self._trial_started = None
+            if self.state == self.HALF_OPEN:
+                # A trial that never reported back (e.g. an abandoned stream)
+                # doesn't block further trials forever
+                now = time.monotonic()
+                if self._trial_started is not None and now - self._trial_started < self.reset_timeout:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name or 'Service'} is being retried")
+                self._trial_started = now
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class ProviderStats:
+    """Rolling latency and failure record for one provider."""
+
+    def __init__(self, window: int = 50):
+        self._samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float, ok: bool):
+        with self._lock:
+            self._samples.append((latency_ms, ok))
+
+    def latency_ms(self, pct: float = 50) -> Optional[float]:
+        """Percentile of recent successful call latencies, None without data."""
+        with self._lock:
+            ordered = sorted(ms for ms, ok in self._samples if ok)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    @property
+    def failure_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    @property
+    def calls(self) -> int:
+        return len(self._samples)
+
+    def score(self) -> float:
+        """
+        Lower is better: median latency, inflated by the recent failure rate.
+        Providers without data score 0 so they get tried.
+        """
+        latency = self.latency_ms(50)
+        if latency is None:
+            return 0.0 if self.calls == 0 else float("inf")
+        return latency / max(0.05, 1.0 - self.failure_rate)
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "p50_ms": self.latency_ms(50),
+            "p95_ms": self.latency_ms(95),
+            "failure_rate": self.failure_rate,
+        }
+
+
+def hedged_call(
+    executor: Executor,
+    fn: Callable[[], T],
+    deadline: Optional[float],
+    hedge_after: Optional[float] = None,
+    hedge_fn: Optional[Callable[[], T]] = None,
+) -> Tuple[T, bool]:
+    """
+    Calls fn() in the executor and waits at most `deadline` seconds.
+
+    If it hasn't returned after hedge_after seconds a second call is started,
+    hedge_fn() if given or else fn() again, and whichever finishes first
+    successfully wins. hedge_after=0 races both from the start. Returns
+    (result, hedged). Raises DeadlineExceeded when the deadline passes, or
+    the last error when every attempt failed. Calls still running at that
+    point are left to finish in the background.
+    """
+    start = time.monotonic()
+    end = start + deadline if deadline is not None else None
+    pending = {executor.submit(fn)}
+    hedged = False
+    error: Optional[BaseException] = None
+
+    while pending:
+        timeout = None if end is None else max(0.0, end - time.monotonic())
+        if not hedged and hedge_after is not None:
+            until_hedge = max(0.0, start + hedge_after - time.monotonic())
+            timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+
+        done, pending = wait(pending, timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result(), hedged
+            error = future.exception()
+
+        if end is not None and time.monotonic() >= end:
+            break
+        if not hedged and hedge_after is not None and (
+            not pending or time.monotonic() >= start + hedge_after
+        ):
+            # Slow (or failed) first attempt: race a second one against it
+            hedged = True
+            pending.add(executor.submit(hedge_fn or fn))
+
+    if pending:
+        raise DeadlineExceeded(f"No response within {deadline:.1f}s")
+    raise error
+
+
+async def hedged_call_async(
+    make_call: Callable[[], Awaitable[T]],
+    deadline: Optional[float],
+    hedge_after: Optional[float] = None,
+    hedge_call: Optional[Callable[[], Awaitable[T]]] = None,
+) -> Tuple[T, bool]:
+    """asyncio version of hedged_call(); losing attempts are cancelled."""
+    start = time.monotonic()
+    end = start + deadline if deadline is not None else None
+    pending = {asyncio.ensure_future(make_call())}
+    hedged = False
+    error: Optional[BaseException] = None
+
+    try:
+        while pending:
+            timeout = None if end is None else max(0.0, end - time.monotonic())
+            if not hedged and hedge_after is not None:
+                until_hedge = max(0.0, start + hedge_after - time.monotonic())
+                timeout = until_hedge if timeout is None else min(timeout, until_hedge)
+
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), hedged
+                error = task.exception()
+
+            if end is not None and time.monotonic() >= end:
+                break
+            if not hedged and hedge_after is not None and (
+                not pending or time.monotonic() >= start + hedge_after
+            ):
+                hedged = True
+                pending.add(asyncio.ensure_future((hedge_call or make_call)()))
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if pending:
+        raise DeadlineExceeded(f"No response within {deadline:.1f}s")
+    raise error
@@ -0,0 +1,103 @@
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from modules.frame_preprocessor import PreprocessedFrame
+from modules.image_utils import AnyImage, gray_thumbnail
+
+
+def scene_thumbnail(image: AnyImage, size: Tuple[int, int] = (32, 24)) -> np.ndarray:
+    """Grayscale thumbnail with its mean brightness removed."""
+    if isinstance(image, PreprocessedFrame) and image.thumbnail.shape == (size[1], size[0]):
+        # Already computed by the preprocessing workers
+        thumb = image.thumbnail
+    elif isinstance(image, PreprocessedFrame):
+        thumb = gray_thumbnail(image.jpeg, size)
+    else:
+        thumb = gray_thumbnail(image, size)
+    return thumb - thumb.mean()
+
+
+def scene_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two scene thumbnails, scaled to 0..1."""
+    return float(np.abs(a - b).mean() / 255.0)
+
+
+class SceneChangeGate:
+    """
+    Decides whether a new frame is different enough to be worth describing.
+
+    Each frame is reduced to a small grayscale thumbnail and compared with the
+    thumbnail of the last frame that was actually analyzed. The difference is
+    the mean absolute pixel difference after removing each thumbnail's mean
+    brightness (so auto-exposure changes alone don't count), scaled to 0..1.
+    Below `threshold` the previous description is reused.
+
+    Args:
+        threshold: Difference below which frames count as the same scene.
+        max_age: Seconds after which a cached description is not reused even
+                 if the scene looks unchanged (None to keep it forever).
+        thumbnail_size: (width, height) of the comparison thumbnail.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.06,
+        max_age: Optional[float] = 60.0,
+        thumbnail_size: Tuple[int, int] = (32, 24),
+    ):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.thumbnail_size = thumbnail_size
+        self.hits = 0
+        self.misses = 0
+        self.last_difference: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thumbnail: Optional[np.ndarray] = None
+        self._description: Optional[str] = None
+        self._analyzed_at = 0.0
+
+    def thumbnail(self, image: AnyImage) -> np.ndarray:
+        return scene_thumbnail(image, self.thumbnail_size)
+
+    def difference(self, thumbnail: np.ndarray) -> float:
+        if self._thumbnail is None:
+            return 1.0
+        return scene_difference(thumbnail, self._thumbnail)
+
+    def lookup(self, thumbnail: np.ndarray) -> Optional[str]:
+        """Returns the previous description if the scene hasn't changed."""
+        with self._lock:
+            self.last_difference = self.difference(thumbnail)
+            fresh = self.max_age is None or time.time() - self._analyzed_at <= self.max_age
+            if self._description is not None and fresh and self.last_difference < self.threshold:
+                self.hits += 1
+                return self._description
+            self.misses += 1
+            return None
+
+    def remember(self, thumbnail: np.ndarray, description: str):
+        with self._lock:
+            self._thumbnail = thumbnail
+            self._description = description
+            self._analyzed_at = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._thumbnail = None
+            self._description = None
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "last_difference": self.last_difference,
+        }
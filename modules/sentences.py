@@ -0,0 +1,40 @@
+import re
+from typing import Iterable, Iterator, List
+
+# End of a sentence: ., ! or ? (optionally followed by closing quotes or
+# brackets) and then whitespace. Decimal numbers like "2.5" don't match.
+_SENTENCE_END = re.compile(r"""[.!?]+["')\]]*\s+""")
+
+# Fragments shorter than this are held back and joined with the next one, so
+# "Hi." or a numbered "1." doesn't become its own TTS request
+MIN_FRAGMENT_CHARS = 12
+
+
+def split_sentences(text: str) -> List[str]:
+    return list(iter_sentences([text]))
+
+
+def iter_sentences(chunks: Iterable[str], min_chars: int = MIN_FRAGMENT_CHARS) -> Iterator[str]:
+    """
+    Regroups streamed text chunks into sentences.
+
+    Each sentence is yielded as soon as the whitespace after its final
+    punctuation arrives; whatever is left when the stream ends is yielded
+    last.
+    """
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        start = 0
+        for match in _SENTENCE_END.finditer(buffer):
+            if match.end() - start < min_chars:
+                continue
+            sentence = buffer[start:match.end()].strip()
+            start = match.end()
+            if sentence:
+                yield sentence
+        buffer = buffer[start:]
+
+    rest = buffer.strip()
+    if rest:
+        yield rest
@@ -1,8 +1,52 @@
 import socket
+import threading
+from typing import Iterator, Optional
+
+from modules.frame_buffers import FrameBufferPool, FrameWriter, PooledFrame
+from modules.frame_protocol import (
+    GET_FRAME,
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    ChunkAssembler,
+    FrameProtocolError,
+    SocketReader,
+    choose_version,
+    parse_hello_versions,
+    proto_command,
+)
 
 HOST = "0.0.0.0"  # Listen on all available network interfaces
 PORT = 9000
 
+STOP_STREAM = b"STOP\n"
+STREAM_STOPPED = "STOPPED"
+
+
+def stream_command(interval_ms: int = 0) -> bytes:
+    """Asks the camera to push frames every interval_ms until told to STOP."""
+    return f"STREAM {interval_ms}\n".encode("utf-8")
+
+
+def parse_size_header(size_line: str) -> int:
+    """Parses a 'SIZE <n>' header line and returns n."""
+    if not size_line.startswith("SIZE"):
+        raise FrameProtocolError(f"Invalid header received: {size_line}")
+    try:
+        return int(size_line.split()[1])
+    except (ValueError, IndexError):
+        raise FrameProtocolError(f"Invalid size format: {size_line}")
+
+
+def parse_hello(hello_line: str):
+    """Parses a 'HELLO <device_id>' line sent by the camera on connect.
+
+    Returns the device id, or None if the line is not a HELLO.
+    """
+    parts = hello_line.split()
+    if len(parts) >= 2 and parts[0] == "HELLO":
+        return parts[1]
+    return None
+
 
 def request(conn, addr):
     """Handles a single, long-lasting client connection."""
@@ -68,26 +112,80 @@ def request(conn, addr):
 
 
 class ESP32Server:
-    def __init__(self, host="0.0.0.0", port=9000):
+    def __init__(
+        self,
+        host="0.0.0.0",
+        port=9000,
+        buffer_pool=None,
+        hello_timeout=2.0,
+        frame_timeout=20.0,
+        max_retries=3,
+    ):
         self.host = host
         self.port = port
+        self.hello_timeout = hello_timeout
+        self.frame_timeout = frame_timeout
+        self.max_retries = max_retries
+        self.protocol = PROTOCOL_V1
+        self.last_frame_id = None
+        self.last_frame_timestamp_us = None
         self.conn = None
         self.addr = None
         self.rfile = None
         self.wfile = None
+        self.device_id = None
+        self.buffer_pool = buffer_pool
+        self.frame_writer = None
+        self.stream_thread = None
+        self.streaming = False
+        self.latest_frame = None
+        self.latest_seq = 0
+        self.frame_ready = threading.Condition()
 
     def start(self):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
             server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server.bind((HOST, PORT))
+            server.bind((self.host, self.port))
             server.listen()
-            print(f"✅ [LISTENING] Server is listening on {HOST}:{PORT}")
+            print(f"✅ [LISTENING] Server is listening on {self.host}:{self.port}")
 
             self.conn, self.addr = server.accept()
             print(f"[NEW CLIENT] Connected by {self.addr}")
 
-            self.rfile = self.conn.makefile("rb")
+            self.rfile = SocketReader(self.conn)
             self.wfile = self.conn.makefile("wb")
+            self._negotiate()
+
+    def _negotiate(self):
+        """Reads the camera's HELLO and switches to protocol v2 if it can."""
+        self.conn.settimeout(self.hello_timeout)
+        try:
+            hello = self.rfile.readline().strip().decode("utf-8", "replace")
+        except TimeoutError:
+            # Older firmware stays silent until it is asked for a frame
+            hello = ""
+
+        try:
+            self.device_id = parse_hello(hello)
+            if not self.device_id:
+                print("Camera did not identify itself, using protocol v1")
+                return
+            print(f"Camera identified as {self.device_id}")
+
+            if choose_version(parse_hello_versions(hello)) == PROTOCOL_V2:
+                self.wfile.write(proto_command(PROTOCOL_V2))
+                self.wfile.flush()
+                ack = self.rfile.readline().strip()
+                if ack == proto_command(PROTOCOL_V2).strip():
+                    self.protocol = PROTOCOL_V2
+            print(f"Using frame protocol v{self.protocol}")
+        except TimeoutError:
+            print("Camera did not acknowledge protocol v2, using v1")
+        finally:
+            # v2 can recover from a stalled transfer, so it gets a timeout
+            self.conn.settimeout(
+                self.frame_timeout if self.protocol == PROTOCOL_V2 else None
+            )
 
     def request_frame(self):
         """Handles a single, long-lasting client connection."""
@@ -95,51 +193,344 @@ class ESP32Server:
         # 'rb' for reading binary, 'wb' for writing binary
 
         try:
-            # Main loop to continuously request frames
+            # 1-4. Request a frame and read all of its bytes
+            with self._receive_frame() as frame:
+                print(f"Successfully received {frame.size} bytes.")
+
+                # 5. Save the image data to a file
+                with open("received_frame.jpg", "wb") as f:
+                    f.write(frame.view)
+            print("✅ Frame saved successfully as received_frame.jpg")
+
+        except Exception as e:
+            print(f"[ERROR] An error occurred: {e}")
+            self.close()
+
+    def request_frame_buffer(
+        self, save_path: Optional[str] = None
+    ) -> Optional[PooledFrame]:
+        """
+        Requests a frame and receives it straight into a pooled buffer.
+
+        Returns a PooledFrame whose `view` can be passed directly to
+        CohereImageAnalyzer; call release() (or use it as a context manager)
+        when done so the buffer can be reused. If save_path is given the frame
+        is also written to disk on a background thread.
+        """
+        try:
+            frame = self._receive_frame()
+        except Exception as e:
+            print(f"[ERROR] An error occurred: {e}")
+            self.close()
+            return None
+
+        print(f"Successfully received {frame.size} bytes.")
+
+        if save_path:
+            if self.frame_writer is None:
+                self.frame_writer = FrameWriter()
+            self.frame_writer.save(frame, save_path)
+
+        return frame
+
+    def request_frames_pipelined(
+        self, count: int, depth: int = 4
+    ) -> Iterator[Optional[PooledFrame]]:
+        """
+        Receives `count` frames while keeping up to `depth` GET_FRAME requests
+        outstanding, so the camera starts on the next frame while this side is
+        still parsing and handling the previous one. Responses arrive in
+        request order. Each yielded frame must be released by the caller.
+
+        Later requests are already queued, so a corrupt v2 frame can't be
+        resent in place. It is skipped and None is yielded in its place; the
+        connection stays open.
+        """
+        if self.buffer_pool is None:
+            self.buffer_pool = FrameBufferPool()
+
+        sent = min(depth, count)
+        self.wfile.write(GET_FRAME * sent)
+        self.wfile.flush()
+
+        received = 0
+        try:
+            while received < count:
+                frame = self._read_pipelined_frame()
+                received += 1
+
+                if sent < count:
+                    self.wfile.write(GET_FRAME)
+                    self.wfile.flush()
+                    sent += 1
+
+                yield frame
+        except GeneratorExit:
+            # The caller stopped early; the frames already asked for still
+            # arrive and would be mistaken for replies to the next request
+            self._discard_frames(sent - received)
+            raise
+        except BaseException:
+            # Part way through a reply, the connection can't be trusted
+            self.close()
+            raise
+
+    def _read_pipelined_frame(self) -> Optional[PooledFrame]:
+        try:
+            return self._read_frame(resend=False)
+        except FrameProtocolError as e:
+            if self.protocol != PROTOCOL_V2:
+                # v1 has no framing to get back in step with
+                raise
+            # The rest of its chunks are skipped as leftovers by the next read
+            print(f"Dropping corrupt pipelined frame: {e}")
+            return None
+
+    def _discard_frames(self, count: int):
+        try:
+            for _ in range(count):
+                frame = self._read_pipelined_frame()
+                if frame is not None:
+                    frame.release()
+        except Exception as e:
+            print(f"[ERROR] Couldn't drain pipelined frames: {e}")
+            self.close()
+
+    def start_stream(self, interval_ms: int = 0):
+        """
+        Switches the camera to push mode: it sends frames continuously and a
+        background thread keeps only the newest one ("latest frame wins").
+        Use get_latest_frame() to read it and stop_stream() to return to
+        request/response mode.
+        """
+        if self.streaming:
+            return
+        if self.buffer_pool is None:
+            # One frame being received, one kept as latest, two for callers
+            self.buffer_pool = FrameBufferPool(count=4)
+
+        self.streaming = True
+        self.wfile.write(stream_command(interval_ms))
+        self.wfile.flush()
+        self.stream_thread = threading.Thread(target=self._stream_loop, daemon=True)
+        self.stream_thread.start()
+        print(f"Streaming frames from ESP32 every {interval_ms} ms")
+
+    def stop_stream(self, timeout: float = 5.0):
+        if not self.streaming:
+            return
+        self.wfile.write(STOP_STREAM)
+        self.wfile.flush()
+        self.stream_thread.join(timeout)
+        if self.stream_thread.is_alive():
+            # The camera never confirmed; unblock the reader by dropping the
+            # connection rather than leave it reading in the background
+            print("⚠️ Camera did not stop streaming, closing the connection")
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.stream_thread.join(timeout)
+            self.close()
+        if not self.stream_thread.is_alive():
+            self.streaming = False
+            print("Stopped streaming frames")
+
+    def get_latest_frame(
+        self, newer_than: int = 0, timeout: Optional[float] = None
+    ) -> Optional[PooledFrame]:
+        """
+        Returns the newest streamed frame whose sequence number is greater than
+        newer_than, or None on timeout. The frame is retained for the caller,
+        who must release() it. Its sequence number is in `latest_seq`.
+        """
+        with self.frame_ready:
+            if not self.frame_ready.wait_for(
+                lambda: self.latest_seq > newer_than or not self.streaming, timeout
+            ):
+                return None
+            # The stream may have ended without anything newer
+            if self.latest_frame is None or self.latest_seq <= newer_than:
+                return None
+            return self.latest_frame.retain()
+
+    def _stream_loop(self):
+        try:
+            while True:
+                try:
+                    frame = self._read_frame(resend=False)
+                except FrameProtocolError as e:
+                    # A newer frame is on its way; no point resending this one
+                    print(f"Dropping corrupt streamed frame: {e}")
+                    continue
+                if frame is None:
+                    break
+
+                with self.frame_ready:
+                    previous = self.latest_frame
+                    self.latest_frame = frame
+                    self.latest_seq += 1
+                    self.frame_ready.notify_all()
+                if previous:
+                    previous.release()
+        except Exception as e:
+            print(f"[ERROR] Stream stopped: {e}")
+        finally:
+            with self.frame_ready:
+                self.streaming = False
+                self.frame_ready.notify_all()
+
+    def _receive_frame(self) -> PooledFrame:
+        if self.protocol == PROTOCOL_V2:
             print("\n-------------------------")
-            # 1. Send the request for a frame
             print("Requesting a new frame from ESP32...")
-            self.wfile.write(b"GET_FRAME\n")
-            self.wfile.flush()  # Ensure the request is sent immediately
+            self.wfile.write(GET_FRAME)
+            self.wfile.flush()
+            frame = self._read_frame()
+            if frame is None:
+                # An empty chunk only makes sense when stopping a stream
+                raise FrameProtocolError("Camera sent an empty frame")
+            return frame
 
-            # 2. Read the size header line from the client
-            # The rfile.readline() correctly reads just one line
-            size_line = self.rfile.readline()
-            if not size_line:
-                print("Client disconnected.")
-                raise Exception("Client disconnected.")
+        size = self._request_frame_header()
+        return self._read_frame_body(size)
 
-            size_line = size_line.strip().decode("utf-8")
-            print(f"Received header: '{size_line}'")
+    def _read_frame(self, resend: bool = True) -> Optional[PooledFrame]:
+        """Reads the next frame in the negotiated protocol.
 
-            # 3. Parse the size from the header
-            if size_line.startswith("SIZE"):
+        Returns None when the camera reports that streaming stopped.
+        """
+        if self.protocol == PROTOCOL_V2:
+            return self._read_frame_v2(resend)
+
+        size = self._read_frame_header()
+        if size is None:
+            return None
+        return self._read_frame_body(size)
+
+    def _read_frame_body(self, size: int) -> PooledFrame:
+        if self.buffer_pool is None:
+            self.buffer_pool = FrameBufferPool()
+        frame = self.buffer_pool.acquire(size)
+        try:
+            self._read_into(frame.view)
+        except Exception:
+            frame.release()
+            raise
+        return frame
+
+    def _read_frame_v2(self, resend: bool = True) -> Optional[PooledFrame]:
+        """
+        Assembles a v2 frame from its chunks. A chunk that fails its CRC, or a
+        transfer that stalls, is requested again from the last good offset
+        (up to max_retries times) without dropping the connection.
+        """
+        if self.buffer_pool is None:
+            self.buffer_pool = FrameBufferPool()
+
+        assembler = ChunkAssembler(self.max_retries, self.last_frame_id)
+        frame = None
+        try:
+            while not assembler.complete:
                 try:
-                    size = int(size_line.split()[1])
-                    print(f"Expecting {size} bytes of image data...")
-                except (ValueError, IndexError):
-                    raise Exception("Invalid size format")
-            else:
-                raise Exception("Invalid header received")
+                    header = self.rfile.read_chunk_header()
+                    if header.total_size == 0:
+                        # Empty chunk: the camera stopped streaming
+                        return None
+                    if not assembler.accepts(header):
+                        self.rfile.skip(header.length)
+                        if assembler.is_gap(header):
+                            if not resend:
+                                raise FrameProtocolError(
+                                    f"Missing chunk at {assembler.next_offset}"
+                                )
+                            print(f"⚠️ Missing chunk at offset {assembler.next_offset}, resending")
+                            self._send(assembler.retry())
+                        continue
+                    if frame is None:
+                        frame = self.buffer_pool.acquire(header.total_size)
 
-            # 4. Read exactly that many bytes for the image
-            image_data = self.rfile.read(size)
+                    # Released straight away so the frame can go back to the pool
+                    with frame.view[header.offset:header.offset + header.length] as payload:
+                        self.rfile.read_exact_into(payload)
+                        verified = assembler.verify(header, payload)
+                    if not verified:
+                        if not resend:
+                            raise FrameProtocolError(f"Corrupt chunk at {header.offset}")
+                        print(f"⚠️ Corrupt chunk at offset {header.offset}, resending")
+                        self._send(assembler.retry())
+                    elif assembler.complete and not assembler.verify_frame(frame.view):
+                        if not resend:
+                            raise FrameProtocolError("Frame checksum mismatch")
+                        print("⚠️ Frame checksum mismatch, resending whole frame")
+                        self._send(assembler.retry(0))
+                except TimeoutError:
+                    if not resend:
+                        raise
+                    print(f"⚠️ Transfer stalled at offset {assembler.next_offset}, resending")
+                    self._send(assembler.retry())
+        except BaseException:
+            if frame is not None:
+                frame.release()
+            if assembler.frame_id is not None:
+                # So the rest of the abandoned frame is skipped as leftovers
+                self.last_frame_id = assembler.frame_id
+            raise
 
-            if len(image_data) < size:
-                raise Exception("Connection closed before full image was received")
+        self.last_frame_id = assembler.header.frame_id
+        self.last_frame_timestamp_us = assembler.header.timestamp_us
+        return frame
 
-            print(f"Successfully received {len(image_data)} bytes.")
+    def _send(self, command: bytes):
+        self.wfile.write(command)
+        self.wfile.flush()
 
-            # 5. Save the image data to a file
-            with open("received_frame.jpg", "wb") as f:
-                f.write(image_data)
-            print("✅ Frame saved successfully as received_frame.jpg")
+    def _request_frame_header(self) -> int:
+        print("\n-------------------------")
+        # 1. Send the request for a frame
+        print("Requesting a new frame from ESP32...")
+        self.wfile.write(GET_FRAME)
+        self.wfile.flush()  # Ensure the request is sent immediately
 
-        except Exception as e:
-            print(f"[ERROR] An error occurred: {e}")
-            self.close()
+        # 2. Read the size header line from the client
+        size = self._read_frame_header()
+        print(f"Expecting {size} bytes of image data...")
+        return size
+
+    def _read_frame_header(self) -> Optional[int]:
+        # The rfile.readline() correctly reads just one line
+        size_line = self._read_line()
+        while parse_hello(size_line):
+            # Newer firmware announces itself with HELLO on connect
+            self.device_id = parse_hello(size_line)
+            print(f"Camera identified as {self.device_id}")
+            size_line = self._read_line()
+
+        if size_line == STREAM_STOPPED:
+            return None
+
+        # 3. Parse the size from the header
+        return parse_size_header(size_line)
+
+    def _read_into(self, view: memoryview):
+        received = 0
+        while received < len(view):
+            n = self.rfile.readinto(view[received:])
+            if not n:
+                raise Exception("Connection closed before full image was received")
+            received += n
+
+    def _read_line(self) -> str:
+        line = self.rfile.readline()
+        if not line:
+            print("Client disconnected.")
+            raise Exception("Client disconnected.")
+        return line.strip().decode("utf-8")
 
     def close(self):
+        if self.latest_frame:
+            self.latest_frame.release()
+            self.latest_frame = None
         if self.conn:
             self.conn.close()
         if self.rfile:
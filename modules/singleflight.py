@@ -0,0 +1,220 @@
+import dataclasses
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from modules.frame_preprocessor import PreprocessedFrame
+from modules.image_utils import AnyImage, content_digest
+from modules.scene_gate import scene_difference, scene_thumbnail
+from modules.vision import API_ERROR, VisionError, VisionResult
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class _Flight:
+    digest: Optional[str]
+    thumbnail: Optional[np.ndarray]
+    future: Future
+    waiters: int = 0
+    # Sentences streamed so far, replayed to callers that join a stream
+    sentences: List[str] = dataclasses.field(default_factory=list)
+    changed: threading.Condition = dataclasses.field(default_factory=threading.Condition)
+
+
+class CoalescingAnalyzer:
+    """
+    Shares one analysis between callers asking about the same scene at once.
+
+    Wraps a CohereImageAnalyzer. While an analysis is in flight, another call
+    of the same kind (analyze, analyze_hazards_fast, analyze_detailed or
+    describe_image_stream) for an image with the same bytes, or whose scene
+    thumbnail differs by less than `threshold`, waits for that call instead
+    of issuing its own and gets a copy of its result with source
+    "coalesced". A caller joining a stream gets every sentence, starting with
+    those already sent; if the caller that started the stream stops reading
+    it early, the others get a VisionError rather than a cut-off
+    description. Once the call returns it is forgotten; repeated requests
+    after that are the scene gate's and the cache's job. Anything else is
+    passed through to the wrapped analyzer.
+
+    Args:
+        analyzer: The CohereImageAnalyzer to put in front of.
+        threshold: Thumbnail difference below which two images count as the
+                   same scene (0 to only coalesce identical bytes).
+        thumbnail_size: (width, height) of the comparison thumbnail.
+    """
+
+    def __init__(
+        self,
+        analyzer,
+        threshold: float = 0.03,
+        thumbnail_size: Tuple[int, int] = (32, 24),
+    ):
+        self.analyzer = analyzer
+        self.threshold = threshold
+        self.thumbnail_size = thumbnail_size
+        self.issued = 0
+        self.coalesced_exact = 0
+        self.coalesced_similar = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, List[_Flight]] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.analyzer, name)
+
+    def analyze(self, image: AnyImage) -> VisionResult:
+        return self._call("analyze", self.analyzer.analyze, image)
+
+    def analyze_hazards_fast(self, image: AnyImage) -> VisionResult:
+        return self._call("hazards_fast", self.analyzer.analyze_hazards_fast, image)
+
+    def analyze_detailed(self, image: AnyImage) -> VisionResult:
+        return self._call("detailed", self.analyzer.analyze_detailed, image)
+
+    def describe_image_stream(self, image: AnyImage, detail: bool = False) -> Iterator[str]:
+        kind = "stream_detailed" if detail else "stream"
+        return self._stream(
+            kind, lambda image: self.analyzer.describe_image_stream(image, detail=detail), image
+        )
+
+    def describe_image_for_blind_person(self, image: AnyImage) -> str:
+        """Returns the description, raising VisionError if there is none."""
+        result = self.analyze(image)
+        if not result.ok:
+            raise VisionError(result)
+        return result.description
+
+    @property
+    def coalesced(self) -> int:
+        return self.coalesced_exact + self.coalesced_similar
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = sum(len(flights) for flights in self._in_flight.values())
+        return {
+            "issued": self.issued,
+            "coalesced": self.coalesced,
+            "coalesced_exact": self.coalesced_exact,
+            "coalesced_similar": self.coalesced_similar,
+            "in_flight": in_flight,
+        }
+
+    def _call(
+        self, kind: str, analyze: Callable[[AnyImage], VisionResult], image: AnyImage
+    ) -> VisionResult:
+        flights, flight, leader = self._join(kind, image)
+        if not leader:
+            result = flight.future.result()
+            return dataclasses.replace(result, source="coalesced")
+
+        try:
+            result = analyze(image)
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        else:
+            flight.future.set_result(result)
+        finally:
+            self._land(kind, flights, flight)
+        return result
+
+    def _stream(
+        self, kind: str, stream: Callable[[AnyImage], Iterator[str]], image: AnyImage
+    ) -> Iterator[str]:
+        flights, flight, leader = self._join(kind, image)
+        if not leader:
+            yield from self._follow(flight)
+            return
+
+        try:
+            for sentence in stream(image):
+                with flight.changed:
+                    flight.sentences.append(sentence)
+                    flight.changed.notify_all()
+                yield sentence
+        except GeneratorExit:
+            # The caller stopped listening, so the rest will never arrive
+            abandoned = VisionResult.failure(API_ERROR, "Stream closed before it finished")
+            flight.future.set_exception(VisionError(abandoned))
+            raise
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        else:
+            flight.future.set_result(None)
+        finally:
+            with flight.changed:
+                flight.changed.notify_all()
+            self._land(kind, flights, flight)
+
+    def _follow(self, flight: _Flight) -> Iterator[str]:
+        sent = 0
+        while True:
+            with flight.changed:
+                flight.changed.wait_for(
+                    lambda: len(flight.sentences) > sent or flight.future.done()
+                )
+                sentences = flight.sentences[sent:]
+            if not sentences:
+                # Raises the error the stream ended with, if any
+                flight.future.result()
+                return
+            sent += len(sentences)
+            yield from sentences
+
+    def _join(self, kind: str, image: AnyImage) -> Tuple[List[_Flight], _Flight, bool]:
+        """Returns (flights of this kind, the flight to use, whether to run it)."""
+        digest, thumbnail = self._fingerprint(image)
+        with self._lock:
+            flights = self._in_flight.setdefault(kind, [])
+            flight = self._match(flights, digest, thumbnail)
+            if flight is not None:
+                flight.waiters += 1
+                return flights, flight, False
+            flight = _Flight(digest, thumbnail, Future())
+            flights.append(flight)
+            self.issued += 1
+            return flights, flight, True
+
+    def _land(self, kind: str, flights: List[_Flight], flight: _Flight):
+        with self._lock:
+            flights.remove(flight)
+        if flight.waiters:
+            logger.info(f"Shared one {kind} call with {flight.waiters} other callers")
+
+    def _match(
+        self, flights: List[_Flight], digest: Optional[str], thumbnail: Optional[np.ndarray]
+    ) -> Optional[_Flight]:
+        if digest is not None:
+            for flight in flights:
+                if flight.digest == digest:
+                    self.coalesced_exact += 1
+                    return flight
+        if thumbnail is not None and self.threshold > 0:
+            for flight in flights:
+                if (
+                    flight.thumbnail is not None
+                    and scene_difference(thumbnail, flight.thumbnail) < self.threshold
+                ):
+                    self.coalesced_similar += 1
+                    return flight
+        return None
+
+    def _fingerprint(self, image: AnyImage):
+        """Returns (content digest, scene thumbnail); either is None if unreadable."""
+        try:
+            if isinstance(image, PreprocessedFrame):
+                digest = image.digest
+            else:
+                digest = content_digest(image)
+        except (OSError, TypeError, ValueError):
+            digest = None
+        try:
+            thumbnail = scene_thumbnail(image, self.thumbnail_size)
+        except (OSError, TypeError, ValueError):
+            thumbnail = None
+        return digest, thumbnail
@@ -1,23 +1,47 @@
-import os
-import tempfile
 import threading
+from typing import Iterable, Optional
 
-import playsound
-from gtts import gTTS
+from modules.audio_output import NORMAL, AudioWorker, Utterance
+from modules.tts import TextToSpeech, default_backends
 
 # If you get namespace GST not found, do sudo apt get install gstreamer-1.0
 
+_tts = None
+_tts_lock = threading.Lock()
 
-def _speak_sync(text):
-    """Internal synchronous speak function."""
-    with tempfile.NamedTemporaryFile(delete=True, suffix=".mp3") as fp:
-        tts = gTTS(text=text, lang="en")
-        tts.save(fp.name)
-        playsound.playsound(fp.name)
 
+def get_tts() -> TextToSpeech:
+    # Built on first use, after main has loaded the .env with the API keys
+    global _tts
+    with _tts_lock:
+        if _tts is None:
+            _tts = TextToSpeech(default_backends())
+        return _tts
 
-def speak(text):
-    """Non-blocking speak function that runs in a background thread."""
-    thread = threading.Thread(target=_speak_sync, args=(text,))
+
+def _play_utterance(utterance: Utterance) -> bool:
+    return get_tts().say(utterance)
+
+
+# Owns the audio output, so speech never overlaps
+audio = AudioWorker(_play_utterance)
+
+
+def warm_up(phrases: Iterable[str]):
+    """
+    Non-blocking: synthesizes the phrases that aren't in the phrase cache
+    yet, so the first time they are spoken they play instantly.
+    """
+    thread = threading.Thread(target=get_tts().warm_up, args=(list(phrases),), daemon=True)
     thread.start()
     return thread
+
+
+def speak(text, priority: int = NORMAL, max_age: Optional[float] = None) -> Utterance:
+    """
+    Non-blocking speak. Texts play one at a time, in call order within a
+    priority; URGENT ones (hazards) cut off anything less urgent. Texts still
+    waiting after max_age seconds are skipped. Returns a handle whose
+    started and finished events report playback.
+    """
+    return audio.say(text, priority, max_age)
@@ -0,0 +1,279 @@
+import abc
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Iterable, List, Optional, Sequence
+
+import pyttsx3
+from google import genai
+from gtts import gTTS
+
+from modules import gemini_tts
+from modules.audio_output import URGENT, Utterance, play_file
+from modules.phrase_cache import PhraseCache
+from modules.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceeded, ProviderStats
+from modules.sentences import split_sentences
+
+logger = logging.getLogger(__name__)
+
+
+class TtsBackend(abc.ABC):
+    """
+    A speech engine that says an Utterance through the audio output.
+
+    Subclasses implement say(), which calls utterance.mark_started() when
+    audio begins and returns False if utterance.interrupt cut it short.
+    Remote backends keep rolling time-to-first-audio stats and a circuit
+    breaker so a slow or unreachable service can be avoided.
+    """
+
+    name = "tts"
+    # Needs the network for text it hasn't spoken before
+    remote = True
+
+    def __init__(self):
+        self.stats = ProviderStats()
+        self.breaker = CircuitBreaker(self.name)
+
+    @abc.abstractmethod
+    def say(self, utterance: Utterance) -> bool:
+        raise NotImplementedError
+
+    def ready_offline(self, text: str) -> bool:
+        """True if the text can be spoken right away without the network."""
+        return not self.remote
+
+    def warm_up(self, phrases: Iterable[str]) -> int:
+        return 0
+
+    def score(self) -> float:
+        return self.stats.score()
+
+
+class GttsBackend(TtsBackend):
+    """
+    Google Translate TTS through gTTS, with every sentence kept in a phrase
+    cache. Multi-sentence texts are synthesized in parallel and played in
+    order from the first sentence that is ready.
+
+    Args:
+        lang: gTTS language.
+        voice: gTTS accent, picked by the Google Translate domain (tld).
+        workers: Sentences synthesized at the same time.
+        first_audio_deadline: Seconds to wait for the first sentence before
+                              giving up (DeadlineExceeded).
+        cache: Phrase cache, by default one in tts_cache/.
+    """
+
+    name = "gtts"
+
+    def __init__(
+        self,
+        lang: str = "en",
+        voice: str = "com",
+        workers: int = 3,
+        first_audio_deadline: Optional[float] = 4.0,
+        cache: Optional[PhraseCache] = None,
+    ):
+        super().__init__()
+        self.lang = lang
+        self.voice = voice
+        self.first_audio_deadline = first_audio_deadline
+        self.cache = cache if cache is not None else PhraseCache()
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="gtts")
+
+    def say(self, utterance: Utterance) -> bool:
+        sentences = split_sentences(utterance.text) or [utterance.text]
+        # Synthesis of later sentences overlaps playback of earlier ones
+        files = [self._pool.submit(self.audio_file, sentence) for sentence in sentences]
+        try:
+            first_audio_by = None
+            if self.first_audio_deadline is not None:
+                first_audio_by = time.monotonic() + self.first_audio_deadline
+            for i, file in enumerate(files):
+                path = self._wait_for_file(file, utterance, first_audio_by if i == 0 else None)
+                if path is None or not play_file(path, utterance):
+                    return False
+            return True
+        finally:
+            for file in files:
+                file.cancel()
+
+    def _wait_for_file(self, file, utterance: Utterance, deadline: Optional[float]) -> Optional[str]:
+        """The synthesized file's path, or None if the utterance was interrupted first."""
+        while not utterance.interrupt.is_set():
+            try:
+                return file.result(timeout=0.05)
+            except FutureTimeoutError:
+                if deadline is not None and time.monotonic() > deadline:
+                    # Left to finish in the background, so it's cached next time
+                    raise DeadlineExceeded(
+                        f"No speech from gTTS within {self.first_audio_deadline:.1f}s"
+                    )
+        return None
+
+    def audio_file(self, text: str) -> str:
+        """Path of the cached audio for text, synthesizing it on a miss."""
+        return self.cache.get_or_create(
+            text, lambda path: self._synthesize(text, path), self.lang, self.voice
+        )
+
+    def _synthesize(self, text: str, path: str):
+        gTTS(text=text, lang=self.lang, tld=self.voice).save(path)
+
+    def ready_offline(self, text: str) -> bool:
+        return all(
+            os.path.exists(self.cache.path(sentence, self.lang, self.voice))
+            for sentence in split_sentences(text)
+        )
+
+    def warm_up(self, phrases: Iterable[str]) -> int:
+        # Cached the way they will be spoken, a sentence at a time
+        sentences = [sentence for phrase in phrases for sentence in split_sentences(phrase)]
+        return self.cache.warm_up(sentences, self._synthesize, self.lang, self.voice)
+
+
+class GeminiTtsBackend(TtsBackend):
+    """Gemini streaming TTS, played as the audio arrives."""
+
+    name = "gemini_tts"
+
+    def __init__(self, api_key: Optional[str] = None, first_audio_deadline: Optional[float] = 4.0):
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise ValueError(
+                "Gemini API key is required. Set GEMINI_API_KEY environment variable or pass it directly."
+            )
+        super().__init__()
+        self.first_audio_deadline = first_audio_deadline
+        self.client = genai.Client(api_key=api_key)
+
+    def say(self, utterance: Utterance) -> bool:
+        return gemini_tts.generate_and_play(
+            self.client, utterance.text, utterance, timeout=self.first_audio_deadline
+        )
+
+
+class Pyttsx3Backend(TtsBackend):
+    """
+    The local speech engine (espeak, SAPI5 or NSSpeechSynthesizer). Works
+    offline and starts at once, but sounds more robotic.
+
+    The engine is created by, and must only be used from, the thread that
+    first calls say(), which is the audio worker.
+    """
+
+    name = "pyttsx3"
+    remote = False
+
+    def __init__(self, rate: Optional[int] = None):
+        super().__init__()
+        self.rate = rate
+        self._engine = None
+
+    def say(self, utterance: Utterance) -> bool:
+        if utterance.interrupt.is_set():
+            return False
+        engine = self._get_engine()
+
+        def on_word(name, location, length):
+            if utterance.interrupt.is_set():
+                engine.stop()
+
+        callbacks = [
+            engine.connect("started-utterance", lambda name: utterance.mark_started()),
+            engine.connect("started-word", on_word),
+        ]
+        try:
+            engine.say(utterance.text)
+            engine.runAndWait()
+        finally:
+            for callback in callbacks:
+                engine.disconnect(callback)
+        return not utterance.interrupt.is_set()
+
+    def _get_engine(self):
+        if self._engine is None:
+            self._engine = pyttsx3.init()
+            if self.rate is not None:
+                self._engine.setProperty("rate", self.rate)
+        return self._engine
+
+
+class TextToSpeech:
+    """
+    Says utterances with the best available backend.
+
+    Remote backends are tried in order of score (median time to first audio,
+    inflated by recent failures), skipping those whose circuit is open; local
+    backends come last. A backend that fails or misses its first-audio
+    deadline before any audio played hands over to the next one, so speech
+    falls back to the local engine when the network is slow or down.
+    URGENT utterances try backends that can speak them without the network
+    (a local engine, or phrases already cached) first, so a hazard warning
+    only waits on a remote service when nothing local can say it.
+    """
+
+    def __init__(self, backends: Sequence[TtsBackend]):
+        if not backends:
+            raise ValueError("At least one TTS backend is required")
+        self.backends = list(backends)
+
+    def ranked_backends(self, utterance: Optional[Utterance] = None) -> List[TtsBackend]:
+        remote = sorted((b for b in self.backends if b.remote), key=lambda b: b.score())
+        ranked = remote + [b for b in self.backends if not b.remote]
+        if utterance is not None and utterance.priority == URGENT:
+            offline = [b for b in ranked if b.ready_offline(utterance.text)]
+            # The rest are still tried if every offline backend fails
+            return offline + [b for b in ranked if b not in offline]
+        return ranked
+
+    def say(self, utterance: Utterance) -> bool:
+        error: Optional[Exception] = None
+        for backend in self.ranked_backends(utterance):
+            try:
+                backend.breaker.check()
+            except CircuitOpenError as e:
+                error = e
+                continue
+
+            start = time.monotonic()
+            try:
+                completed = backend.say(utterance)
+            except Exception as e:
+                backend.stats.record((time.monotonic() - start) * 1000, False)
+                backend.breaker.record_failure()
+                if utterance.started.is_set():
+                    raise
+                logger.warning(f"{backend.name} couldn't speak, trying the next backend: {e}")
+                error = e
+                continue
+
+            backend.breaker.record_success()
+            if utterance.started.is_set():
+                backend.stats.record((utterance.started_at - start) * 1000, True)
+            return completed
+
+        raise RuntimeError(f"No TTS backend could speak: {error}")
+
+    def warm_up(self, phrases: Iterable[str]):
+        phrases = list(phrases)
+        for backend in self.backends:
+            backend.warm_up(phrases)
+
+    def stats(self) -> dict:
+        return {
+            backend.name: {**backend.stats.summary(), "circuit": backend.breaker.state}
+            for backend in self.backends
+        }
+
+
+def default_backends() -> List[TtsBackend]:
+    """gTTS, Gemini if GEMINI_API_KEY is set, and the local engine."""
+    backends: List[TtsBackend] = [GttsBackend()]
+    if os.getenv("GEMINI_API_KEY"):
+        backends.append(GeminiTtsBackend())
+    backends.append(Pyttsx3Backend())
+    return backends
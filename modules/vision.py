@@ -0,0 +1,140 @@
+import abc
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from modules.resilience import CircuitBreaker, ProviderStats
+
+# VisionResult.error_kind values
+TIMEOUT = "timeout"
+UNAVAILABLE = "unavailable"
+API_ERROR = "api_error"
+BAD_IMAGE = "bad_image"
+
+# VisionResult.confidence value that calls for a more detailed look
+LOW_CONFIDENCE = "low"
+
+
+@dataclass
+class VisionResult:
+    """
+    Outcome of one image analysis.
+
+    Either description is set, or error and error_kind say what went wrong.
+    source is "model", "scene_gate", "cache" or "coalesced" (shared with a
+    concurrent caller); provider names the vision provider that answered,
+    and hedged is True when a second request was raced against the first.
+    """
+
+    description: Optional[str] = None
+    error: Optional[str] = None
+    error_kind: Optional[str] = None
+    source: str = "model"
+    latency_ms: float = 0.0
+    hedged: bool = False
+    provider: Optional[str] = None
+    # Model's own confidence, for answers that report one (hazard fast pass)
+    confidence: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.description is not None
+
+    @property
+    def low_confidence(self) -> bool:
+        return self.confidence == LOW_CONFIDENCE
+
+    @classmethod
+    def failure(cls, kind: str, error, latency_ms: float = 0.0) -> "VisionResult":
+        return cls(error=str(error), error_kind=kind, latency_ms=latency_ms)
+
+
+class VisionError(Exception):
+    """Raised by the plain-text describe methods when analysis fails."""
+
+    def __init__(self, result: VisionResult):
+        super().__init__(result.error)
+        self.result = result
+
+    @property
+    def kind(self) -> Optional[str]:
+        return self.result.error_kind
+
+
+class VisionProvider(abc.ABC):
+    """
+    A vision model that can describe a JPEG.
+
+    Subclasses implement describe() and may override describe_async() and
+    stream(); the defaults run describe() in a thread and yield its whole
+    answer at once. Every provider keeps its own rolling stats and circuit
+    breaker so a slow or failing vendor can be avoided.
+    """
+
+    name = "provider"
+    model = ""
+
+    def __init__(self):
+        self.stats = ProviderStats()
+        self.breaker = CircuitBreaker(self.name)
+
+    @abc.abstractmethod
+    def describe(
+        self, jpeg: bytes, prompt: str, max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        raise NotImplementedError
+
+    async def describe_async(
+        self, jpeg: bytes, prompt: str, max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> str:
+        return await asyncio.to_thread(self.describe, jpeg, prompt, max_tokens, timeout)
+
+    def stream(
+        self, jpeg: bytes, prompt: str, max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Yields text deltas."""
+        yield self.describe(jpeg, prompt, max_tokens, timeout)
+
+    def score(self) -> float:
+        return self.stats.score()
+
+
+class StubVisionProvider(VisionProvider):
+    """
+    Offline provider for tests and benchmarks. Returns a fixed description
+    after `latency` seconds, and fails with probability failure_rate.
+    """
+
+    def __init__(
+        self,
+        description: str = "There is a clear path ahead of you.",
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        name: str = "stub",
+        seed: Optional[int] = None,
+    ):
+        self.name = name
+        self.model = name
+        super().__init__()
+        self.description = description
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def _answer(self) -> str:
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.name} failed")
+        return self.description
+
+    def describe(self, jpeg, prompt, max_tokens=None, timeout=None) -> str:
+        time.sleep(self.latency)
+        return self._answer()
+
+    async def describe_async(self, jpeg, prompt, max_tokens=None, timeout=None) -> str:
+        await asyncio.sleep(self.latency)
+        return self._answer()
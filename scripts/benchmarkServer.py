@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# python -m scripts.benchmarkServer
+# to run this script
+#
+# Benchmarks the ESP32Server frame transport against a simulated ESP32 that
+# runs in a separate process, so no camera is needed and the CPU numbers only
+# cover the server side. Use --min-fps to fail (exit 1) on a regression.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+
+from modules.esp32_simulator import SimulatedESP32, frame_capture_time
+from modules.frame_protocol import FrameProtocolError
+from modules.server import ESP32Server
+
+MODES = ["request", "buffer", "pipelined", "stream"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_simulator(port, frame_sizes, bandwidth_bps, jitter, capture_time, faults):
+    sim = SimulatedESP32(
+        "127.0.0.1",
+        port,
+        frame_sizes=frame_sizes,
+        bandwidth_bps=bandwidth_bps,
+        jitter=jitter,
+        capture_time=capture_time,
+        seed=0,
+        **faults,
+    )
+    sim.connect()
+    sim.run()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _receive(server, mode, frames, depth):
+    """
+    Receives frames in the given mode and returns per-frame latencies, the
+    bytes received and how many frames failed.
+    """
+    latencies = []
+    total_bytes = 0
+    failed = 0
+
+    if mode == "request":
+        for _ in range(frames):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove("received_frame.jpg")
+            start = time.perf_counter()
+            server.request_frame()
+            if not os.path.exists("received_frame.jpg"):
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            # Frames differ in size when several --frame-size values are given
+            total_bytes += os.path.getsize("received_frame.jpg")
+
+    elif mode == "buffer":
+        for _ in range(frames):
+            start = time.perf_counter()
+            frame = server.request_frame_buffer()
+            if frame is None:
+                failed += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            total_bytes += frame.size
+            frame.release()
+
+    elif mode == "pipelined":
+        # Latency is measured from when each frame's request was sent
+        sent_at = [time.perf_counter()] * min(depth, frames)
+        try:
+            for i, frame in enumerate(server.request_frames_pipelined(frames, depth)):
+                sent_at.append(time.perf_counter())
+                if frame is None:
+                    # Dropped as corrupt; counted as failed below
+                    continue
+                latencies.append(time.perf_counter() - sent_at[i])
+                total_bytes += frame.size
+                frame.release()
+        except (OSError, FrameProtocolError) as e:
+            # The connection is closed, so the rest of the batch is lost
+            print(f"[ERROR] Pipelined batch failed: {e}")
+        failed = frames - len(latencies)
+
+    elif mode == "stream":
+        # Latency is the age of the frame (since capture) when it is handed out
+        server.start_stream()
+        seq = 0
+        for _ in range(frames):
+            frame = server.get_latest_frame(newer_than=seq, timeout=10)
+            if frame is None:
+                if not server.streaming:
+                    raise RuntimeError("Stream stopped before enough frames arrived")
+                failed += 1
+                continue
+            latencies.append(time.time() - frame_capture_time(frame.view))
+            seq = server.latest_seq
+            total_bytes += frame.size
+            frame.release()
+        server.stop_stream()
+
+    return latencies, total_bytes, failed
+
+
+def benchmark(mode, args) -> dict:
+    port = _free_port()
+    sim = multiprocessing.Process(
+        target=_run_simulator,
+        args=(
+            port,
+            args.frame_size,
+            args.bandwidth_mbps * 1e6 if args.bandwidth_mbps else None,
+            args.jitter_ms / 1000,
+            args.capture_ms / 1000,
+            {
+                "protocol_versions": tuple(range(1, args.protocol + 1)),
+                "corrupt_rate": args.corrupt_rate,
+                "drop_rate": args.drop_rate,
+            },
+        ),
+        daemon=True,
+    )
+    server = ESP32Server("127.0.0.1", port, frame_timeout=1.0, max_retries=10)
+
+    # The server prints per frame; keep that cost but not the output. Run in a
+    # scratch directory since request_frame() writes received_frame.jpg.
+    with (
+        open(os.devnull, "w") as devnull,
+        contextlib.redirect_stdout(devnull),
+        tempfile.TemporaryDirectory() as scratch,
+        contextlib.chdir(scratch),
+    ):
+        sim.start()
+        server.start()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        latencies, total_bytes, failed = _receive(server, mode, args.frames, args.depth)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        server.close()
+
+    sim.join(timeout=5)
+    if sim.is_alive():
+        sim.terminate()
+
+    if not latencies:
+        raise RuntimeError(f"No frames received in {mode} mode")
+
+    return {
+        "mode": mode,
+        "frames": len(latencies),
+        "failed": failed,
+        "fps": len(latencies) / wall,
+        "mb_per_s": total_bytes / wall / 1e6,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "cpu_ms_per_frame": cpu / len(latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ESP32 frame transport benchmark")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--frame-size", type=int, nargs="+", default=[120_000])
+    parser.add_argument("--bandwidth-mbps", type=float, default=None)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--capture-ms", type=float, default=0.0)
+    parser.add_argument("--depth", type=int, default=4, help="pipeline depth")
+    parser.add_argument("--protocol", type=int, choices=[1, 2], default=2)
+    parser.add_argument("--corrupt-rate", type=float, default=0.0, help="v2 only")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="v2 only")
+    parser.add_argument("--min-fps", type=float, default=None)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = [benchmark(mode, args) for mode in args.modes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(
+            f"{'mode':<10} {'frames/s':>9} {'MB/s':>7} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'CPU ms/frame':>13} {'failed':>7}"
+        )
+        for r in results:
+            print(
+                f"{r['mode']:<10} {r['fps']:>9.2f} {r['mb_per_s']:>7.2f} "
+                f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                f"{r['cpu_ms_per_frame']:>13.3f} {r['failed']:>7}"
+            )
+
+    if args.min_fps is not None:
+        slow = [r["mode"] for r in results if r["fps"] < args.min_fps]
+        if slow:
+            print(f"❌ Below {args.min_fps} frames/s: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# python -m scripts.describeImages images/*.jpg
+# to run this script
+#
+# Backfills descriptions for saved photos, several requests at a time.
+
+import argparse
+import asyncio
+import time
+
+import dotenv
+
+from modules.cohere_analyzer import CohereImageAnalyzer
+from modules.description_cache import DescriptionCache
+
+
+async def describe(args):
+    analyzer = CohereImageAnalyzer(
+        prompt_index=args.prompt_index,
+        requests_per_minute=args.requests_per_minute,
+        # Re-running a backfill only pays for images it hasn't seen
+        cache=DescriptionCache(),
+    )
+    start = time.perf_counter()
+    failed = 0
+    async for i, result in analyzer.describe_many(args.images, args.concurrency):
+        if result.ok:
+            print(f"{args.images[i]}: {result.description}")
+        else:
+            failed += 1
+            print(f"{args.images[i]}: failed ({result.error_kind}) {result.error}")
+    elapsed = time.perf_counter() - start
+    print(f"Described {len(args.images) - failed} of {len(args.images)} images in {elapsed:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Describe saved photos")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=None)
+    parser.add_argument("--prompt-index", type=int, default=3)
+    args = parser.parse_args()
+
+    dotenv.load_dotenv()
+    asyncio.run(describe(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# python -m scripts.enrollKeywords
+# to run this script
+
+"""
+Records each command word a few times as templates for the on-device
+keyword spotter, so commands no longer need cloud speech recognition.
+"""
+
+import argparse
+
+import speech_recognition as sr
+
+from modules.keyword_spotter import DEFAULT_TEMPLATES_DIR, KeywordSpotter
+from modules.noise_calibration import NoiseCalibration
+
+
+def enroll(args):
+    spotter = KeywordSpotter(args.keywords, args.templates_dir)
+    recognizer = sr.Recognizer()
+    mic = sr.Microphone()
+    NoiseCalibration().prepare(recognizer, mic)
+
+    with mic as source:
+        for keyword in args.keywords:
+            recorded = 0
+            while recorded < args.repeats:
+                print(f"Say '{keyword}' ({recorded + 1}/{args.repeats})")
+                audio = recognizer.listen(source, phrase_time_limit=3)
+                if spotter.enroll(keyword, audio, recognizer.energy_threshold):
+                    recorded += 1
+                else:
+                    print("Didn't catch a single word, please try again.")
+
+    print(f"Templates saved in {args.templates_dir}/")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("keywords", nargs="*", default=["snapshot", "recall", "more"])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--templates-dir", default=DEFAULT_TEMPLATES_DIR)
+    enroll(parser.parse_args())
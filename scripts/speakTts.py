@@ -5,4 +5,4 @@
 from modules.speak import speak
 
 if __name__ == "__main__":
-    speak("Hello, how are you?")
+    speak("Hello, how are you?").wait()